@@ -5,16 +5,54 @@ A behavioural design pattern that allows an object to pass a request along a cha
 
 Examples:
 - The pattern is commonly seen in logging, whereby an event can be handled by multiple handlers (each logging the event in its own way), depending on its severity.
+
+BufferedFileLogger:
+- The plain FileLogger opens, appends to and closes the file for every message. The buffered version keeps the file open, queues messages in memory and lets a background thread write them out once the buffer is big enough or old enough. The buffer is swapped for an empty one under the lock and written out after releasing it, so logging threads never wait on disk I/O. flush() / close() can be called explicitly, and close() is registered with atexit so nothing buffered is lost at shutdown. If a write fails, e.g. the disk is full, the lines are kept to retry on the next flush and write_errors / last_error record the failure, so the background thread keeps running.
+
+CompiledLoggerChain:
+- Logger.log recurses through every link on every call, even when a handler's level filters the message out, and long chains hit Python's recursion limit. The compiled chain walks the links once and caches, per message level, the flat tuple of handlers that will actually write. Each link keeps a weak set of the compiled chains it belongs to, and a set_next_logger call or level change on that link marks just those chains stale, so a compiled chain only rebuilds its table (the next time it is used) when one of its own links changes. Output order matches the recursive version.
+
+DigestEmailLogger:
+- The plain EmailLogger sends one email per message, which floods the mail relay during an incident. The digest version queues messages and a background thread sends them as a single digest email once max_batch_size messages are waiting or batch_window seconds have passed. Repeated messages are collapsed into one line with a count, and once more than max_digests emails have gone out within rate_period seconds, sending pauses and messages keep collapsing; anything beyond max_pending distinct messages is dropped and reported as a count in the next digest. The SMTP client is created through smtp_factory, so a local in-process stand-in can be plugged in (see LocalSMTPStandIn below). If sending fails, e.g. the relay is down, the digest's messages go back into the pending queue to be retried with the next digest, and send_errors / last_error record the failure (failed sends do not count towards the rate limit), so neither the background thread nor close() at shutdown is brought down by it.
 '''
 
+import atexit
+import smtplib
+from collections import deque
+from email.message import EmailMessage
+import os
+import tempfile
+import threading
+import time
+import weakref
+
 
 class Logger:
     def __init__(self, level):
+        # The compiled chains this link is part of, marked stale when its level or next link changes
+        self.compiled_chains = weakref.WeakSet()
         self.level = level
         self.next_logger = None
 
+    @property
+    def level(self):
+        return self._level
+
+    @level.setter
+    def level(self, level):
+        self._level = level
+        self._changed()
+
     def set_next_logger(self, next_logger):
         self.next_logger = next_logger
+        self._changed()
+
+    def _changed(self):
+        for chain in self.compiled_chains:
+            chain.stale = True
+
+    def compile(self):
+        return CompiledLoggerChain(self)
 
     def log(self, message, level):
         if self.level <= level:
@@ -27,6 +65,45 @@ class Logger:
         raise NotImplementedError
 
 
+class CompiledLoggerChain:
+    def __init__(self, head):
+        self.head = head
+        self.stale = True
+        self.handlers = ()
+        self.table = {}
+
+    def _rebuild(self):
+        # Cleared first, so a change made while rebuilding still triggers another rebuild
+        self.stale = False
+        handlers = []
+        seen = set()
+        logger = self.head
+        while logger is not None:
+            if id(logger) in seen:
+                raise ValueError("Logger chain contains a cycle")
+            seen.add(id(logger))
+            logger.compiled_chains.add(self)
+            handlers.append(logger)
+            logger = logger.next_logger
+        self.handlers = tuple(handlers)
+        self.table = {}
+
+    def handlers_for(self, level):
+        if self.stale:
+            self._rebuild()
+        try:
+            return self.table[level]
+        except KeyError:
+            matched = tuple(
+                handler for handler in self.handlers if handler.level <= level)
+            self.table[level] = matched
+            return matched
+
+    def log(self, message, level):
+        for handler in self.handlers_for(level):
+            handler.write_message(message)
+
+
 class ConsoleLogger(Logger):
     def write_message(self, message):
         print("ConsoleLogger: " + message)
@@ -42,6 +119,79 @@ class FileLogger(Logger):
             file.write("FileLogger: " + message + "\n")
 
 
+class BufferedFileLogger(FileLogger):
+    def __init__(self, level, filename, buffer_size=1000, flush_interval=1.0):
+        super().__init__(level, filename)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.file = open(self.filename, 'a')
+        self.closed = False
+        self.write_errors = 0
+        self.last_error = None
+        self.lock = threading.Lock()
+        # Held while writing to the file, so logging threads only ever wait for the buffer swap
+        self.file_lock = threading.Lock()
+        self.flush_needed = threading.Condition(self.lock)
+        self.writer = threading.Thread(target=self._run_writer, daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def write_message(self, message):
+        with self.lock:
+            if self.closed:
+                raise ValueError("Cannot log to a closed BufferedFileLogger")
+            self.buffer.append("FileLogger: " + message + "\n")
+            if len(self.buffer) >= self.buffer_size:
+                self.flush_needed.notify()
+
+    def flush(self):
+        # The file lock is taken first, so buffers swapped out by concurrent flushes are written in order
+        with self.file_lock:
+            with self.lock:
+                lines, self.buffer = self.buffer, []
+            try:
+                if lines:
+                    self.file.writelines(lines)
+                    lines = []
+                if not self.file.closed:
+                    self.file.flush()
+            except OSError as exception:
+                # e.g. the disk is full. Lines not yet handed to the file go back ahead of anything
+                # logged since, and the file keeps what it already has buffered, so both are retried
+                self._write_failed(exception, lines)
+
+    def _write_failed(self, exception, lines):
+        with self.lock:
+            self.write_errors += 1
+            self.last_error = exception
+            self.buffer[:0] = lines
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.flush_needed.notify()
+        self.writer.join()
+        self.flush()
+        with self.file_lock:
+            try:
+                self.file.close()
+            except OSError as exception:
+                self._write_failed(exception, [])
+        atexit.unregister(self.close)
+
+    def _run_writer(self):
+        while True:
+            with self.lock:
+                if self.closed:
+                    return
+                # Wake on a full buffer, on close(), or when the interval has passed
+                self.flush_needed.wait(self.flush_interval)
+            self.flush()
+
+
 class EmailLogger(Logger):
     def __init__(self, level, email):
         super().__init__(level)
@@ -52,6 +202,152 @@ class EmailLogger(Logger):
         print("EmailLogger: Sending email to " + self.email)
 
 
+class DigestEmailLogger(EmailLogger):
+    def __init__(self, level, email, sender='logger@localhost', smtp_factory=None,
+                 smtp_host='localhost', smtp_port=25, max_batch_size=50,
+                 batch_window=30.0, max_digests=5, rate_period=60.0, max_pending=1000):
+        super().__init__(level, email)
+        self.sender = sender
+        self.smtp_factory = smtp_factory or (
+            lambda: smtplib.SMTP(smtp_host, smtp_port))
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.max_digests = max_digests
+        self.rate_period = rate_period
+        self.max_pending = max_pending
+        # message -> repeat count, insertion ordered so digests keep arrival order
+        self.pending = {}
+        self.dropped = 0
+        self.sent_times = deque()
+        self.digests_sent = 0
+        self.send_errors = 0
+        self.last_error = None
+        self.closed = False
+        self.lock = threading.Lock()
+        self.send_needed = threading.Condition(self.lock)
+        self.sender_thread = threading.Thread(target=self._run_sender, daemon=True)
+        self.sender_thread.start()
+        atexit.register(self.close)
+
+    def write_message(self, message):
+        with self.lock:
+            if self.closed:
+                raise ValueError("Cannot log to a closed DigestEmailLogger")
+            if message in self.pending:
+                self.pending[message] += 1
+            elif len(self.pending) >= self.max_pending:
+                self.dropped += 1
+            else:
+                self.pending[message] = 1
+                if len(self.pending) >= self.max_batch_size:
+                    self.send_needed.notify()
+
+    def flush(self):
+        # Send everything pending now, ignoring the rate limit
+        with self.lock:
+            batches = self._take_batches(everything=True)
+        self._send_batches(batches)
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.send_needed.notify()
+        self.sender_thread.join()
+        self.flush()
+        atexit.unregister(self.close)
+
+    def _rate_limited(self):
+        now = time.monotonic()
+        while self.sent_times and now - self.sent_times[0] >= self.rate_period:
+            self.sent_times.popleft()
+        return len(self.sent_times) >= self.max_digests
+
+    def _take_batches(self, everything=False):
+        # Caller must hold self.lock
+        batches = []
+        while self.pending or (self.dropped and not batches):
+            if not everything and self._rate_limited():
+                break
+            lines = list(self.pending.items())[:self.max_batch_size]
+            for line, _ in lines:
+                del self.pending[line]
+            batches.append((lines, self.dropped))
+            self.dropped = 0
+            if not everything:
+                break
+        return batches
+
+    def _send_digest(self, lines, dropped):
+        total = sum(count for _, count in lines)
+        body = []
+        for line, count in lines:
+            body.append(line if count == 1 else f"{line} (x{count})")
+        if dropped:
+            body.append(f"... {dropped} further messages dropped (more than {self.max_pending} distinct messages pending)")
+        digest = EmailMessage()
+        digest['Subject'] = f"Log digest: {total} messages ({len(lines)} distinct)"
+        digest['From'] = self.sender
+        digest['To'] = self.email
+        digest.set_content("\n".join(body))
+        with self.smtp_factory() as smtp:
+            smtp.send_message(digest)
+        self.digests_sent += 1
+        print(f"EmailLogger: Sending digest of {total} messages ({len(lines)} distinct) to {self.email}")
+
+    def _run_sender(self):
+        while True:
+            with self.lock:
+                if self.closed:
+                    return
+                self.send_needed.wait(self.batch_window)
+                batches = self._take_batches()
+            self._send_batches(batches)
+
+    def _send_batches(self, batches):
+        # Send outside the lock so logging threads never wait on the relay
+        for index, batch in enumerate(batches):
+            try:
+                self._send_digest(*batch)
+                with self.lock:
+                    # Only digests that actually went out count towards the rate limit
+                    self.sent_times.append(time.monotonic())
+            except Exception as exception:
+                # The relay is unavailable - keep this and the remaining batches to retry next time
+                with self.lock:
+                    self.send_errors += 1
+                    self.last_error = exception
+                    self._requeue(batches[index:])
+                return
+
+    def _requeue(self, batches):
+        # Caller must hold self.lock. Requeued lines go ahead of anything logged since
+        requeued = {}
+        for lines, dropped in batches:
+            for line, count in lines:
+                requeued[line] = requeued.get(line, 0) + count
+            self.dropped += dropped
+        for line, count in self.pending.items():
+            requeued[line] = requeued.get(line, 0) + count
+        self.pending = requeued
+
+
+class LocalSMTPStandIn:
+    # In-process stand-in with the parts of the smtplib.SMTP interface the digest logger uses
+    def __init__(self, outbox):
+        self.outbox = outbox
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def send_message(self, message):
+        self.outbox.append(message)
+
+
 # Create the chain of log handlers
 console_logger = ConsoleLogger(1)
 file_logger = FileLogger(2, 'app.log')
@@ -66,3 +362,47 @@ console_logger.log("Debug message", 1)  # ConsoleLogger: Debug message
 console_logger.log("Info message", 2)
 # ConsoleLogger: Error message\nFileLogger: Error message\nEmailLogger: Sending email to admin@example.com
 console_logger.log("Error message", 3)
+
+# Compiled chain - same output, but each call goes straight to the matching handlers
+compiled_chain = console_logger.compile()
+compiled_chain.log("Debug message", 1)  # ConsoleLogger: Debug message
+compiled_chain.log("Error message", 3)
+
+
+def benchmark_file_loggers(count=20000):
+    # Compare open-per-message FileLogger with the buffered version
+    with tempfile.TemporaryDirectory() as directory:
+        results = {}
+        for logger_class in (FileLogger, BufferedFileLogger):
+            filename = os.path.join(directory, logger_class.__name__ + '.log')
+            logger = logger_class(1, filename)
+            start = time.perf_counter()
+            for i in range(count):
+                logger.log(f"Message {i}", 1)
+            if isinstance(logger, BufferedFileLogger):
+                logger.close()
+            elapsed = time.perf_counter() - start
+            results[logger_class.__name__] = count / elapsed
+            print(f"{logger_class.__name__}: {count / elapsed:,.0f} messages/sec")
+        return results
+
+
+# Buffered file logging - messages are written by a background thread
+buffered_logger = BufferedFileLogger(2, 'app.log', buffer_size=100, flush_interval=0.5)
+buffered_logger.log("Buffered info message", 2)
+buffered_logger.flush()  # Force the buffered message to disk now
+buffered_logger.close()  # Flushes anything remaining and closes the file
+
+# Digest email logging - repeated errors go out as one collapsed email
+outbox = []
+digest_logger = DigestEmailLogger(
+    3, 'admin@example.com', smtp_factory=lambda: LocalSMTPStandIn(outbox), batch_window=0.5)
+for _ in range(100):
+    digest_logger.log("Database connection lost", 3)
+digest_logger.log("Disk almost full", 3)
+digest_logger.close()  # EmailLogger: Sending digest of 101 messages (2 distinct) to admin@example.com
+print(outbox[0].get_content())  # Database connection lost (x100)\nDisk almost full
+
+
+if __name__ == "__main__":
+    benchmark_file_loggers()
@@ -11,19 +11,202 @@ Example:
 - The below example shows a text editor (receiver), with Command classes that create insert and delete text operations on the receiver.
 - All commands are executed through the invoker.
 - The invoker keeps a record of all executed commands in order, allowing for undo operations to be completed (as the command themselves hold the information of their actions).
+
+PieceTableTextEditor:
+- Commands edit the receiver through insert / delete / get_text / replace rather than slicing its content directly, so the receiver's storage can be swapped out. The plain TextEditor rebuilds one big string on every edit. The piece table version stores the document as a list of pieces, each a (buffer, start, length) view onto an immutable string. Edits split pieces at the edit boundaries and insert / remove pieces, so their cost depends on the number of pieces rather than the number of characters in the document. The full content is only joined together when it is read.
+
+Coalescing and bounded history:
+- An Invoker created with coalesce=True asks the most recent command whether it can merge() the new one. Consecutive inserts at contiguous positions, and consecutive backspaces / forward deletes, become a single command that undoes and redoes as one. max_commands and max_bytes cap the history, with the oldest commands being dropped first. Each command reports its size() as the number of characters it holds.
+
+MacroCommand:
+- Applies a batch of commands (e.g. a find-and-replace across the document) as one command. The batch is run against a scratch piece table seeded with the editor's content, and the result is written back to the editor in a single rebuild and rendered once, rather than rebuilding and rendering for each edit. If any command in the batch fails, the editor is left untouched. The batch undoes and redoes as a single unit.
+
+CommandJournal:
+- An Invoker given a journal appends every executed, undone and redone command to an append-only file as a line of JSON, so a crashed session can be recovered. Every checkpoint_every records, the editor content and the newest checkpoint_history commands of the undo / redo history are written to a separate checkpoint file along with the journal offset they correspond to. CommandJournal.recover() loads the latest checkpoint and only replays the journal from that offset onwards, against a silent piece table, before copying the result into the editor. Undo and redo records carry their command, so undoing further back than the checkpointed history still replays correctly. A final record that is missing its newline or does not parse is treated as torn by the crash and truncated, while a damaged record anywhere else raises ValueError and leaves the journal untouched. Records are flushed to the OS as they are written, and with fsync=True also synced to disk.
+
+Rendering:
+- Commands call editor.changed() after each edit rather than printing the document themselves. By default the editor renders straight away through its renderer callback (print). With deferred=True, changed() only marks the editor dirty and render() redraws at most once, however many edits happened since the last frame - the deferred_rendering() context manager does this for a batch of commands. renderer=None turns rendering off entirely for headless / batch runs.
+
+ConcurrentInvoker:
+- The Invoker and editor are not thread safe, so edits submitted concurrently can be lost. The concurrent front-end lets any thread submit() a command (or submit_async() from an asyncio task) and get back a future. A single applier thread takes submitted commands off a queue in batches, executes them through the wrapped Invoker in submission order with rendering deferred to once per batch, and resolves each future once its command has been applied.
 '''
 
+import asyncio
+import json
+import os
+import queue
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from bisect import bisect_right
 from collections import deque
+from contextlib import contextmanager
+from itertools import accumulate, islice
 
 
 class TextEditor:
 
-    def __init__(self):
-        self.content = ""
+    def __init__(self, content="", renderer=print, deferred=False):
+        self.content = content
+        self.renderer = renderer
+        self.deferred = deferred
+        self.dirty = False
         print(f"Editor created.")
 
+    def __len__(self):
+        return len(self.content)
+
+    def get_text(self, start, length):
+        return self.content[start:start + length]
+
+    def insert(self, start, text):
+        self.content = self.content[:start] + text + self.content[start:]
+
+    def delete(self, start, length):
+        deleted_text = self.content[start:start + length]
+        self.content = self.content[:start] + self.content[start + length:]
+        return deleted_text
+
+    def replace(self, start, length, text):
+        self.content = self.content[:start] + text + \
+            self.content[start + length:]
+
     def print_content(self):
-        print(self.content)
+        (self.renderer or print)(self.content)
+
+    def changed(self):
+        if self.renderer is None:
+            return
+        if self.deferred:
+            self.dirty = True
+        else:
+            self.print_content()
+
+    def render(self):
+        # Redraw once if anything has changed since the last render
+        if self.dirty and self.renderer is not None:
+            self.dirty = False
+            self.print_content()
+
+    @contextmanager
+    def deferred_rendering(self):
+        deferred = self.deferred
+        self.deferred = True
+        try:
+            yield self
+        finally:
+            self.deferred = deferred
+            # A nested block, or an editor that is always deferred, leaves the render to its owner
+            if not deferred:
+                self.render()
+
+
+class PieceTableTextEditor(TextEditor):
+    small_piece = 256
+
+    def __init__(self, content="", renderer=print, deferred=False):
+        self.pieces = []
+        self.lengths = []
+        self.length = 0
+        self._content = None
+        super().__init__(content, renderer, deferred)
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = "".join(
+                buffer[start:start + length] for buffer, start, length in self.pieces)
+        return self._content
+
+    @content.setter
+    def content(self, content):
+        self.pieces = [(content, 0, len(content))] if content else []
+        self.lengths = [len(content)] if content else []
+        self.length = len(content)
+        self._content = content
+
+    def __len__(self):
+        return self.length
+
+    def _clamp(self, start, length=0):
+        # Match the clamping behaviour of string slicing
+        start = min(max(start, 0), self.length)
+        return start, min(max(length, 0), self.length - start)
+
+    def _locate(self, position):
+        # Index of the piece containing position, and the offset into that piece
+        if position >= self.length:
+            return len(self.pieces), 0
+        ends = list(accumulate(self.lengths))
+        index = bisect_right(ends, position)
+        return index, position - (ends[index - 1] if index else 0)
+
+    def _split(self, position):
+        # Ensure a piece boundary at position, returning the index of the piece starting there
+        index, offset = self._locate(position)
+        if offset == 0 or index == len(self.pieces):
+            return index
+        buffer, start, length = self.pieces[index]
+        self.pieces[index:index + 1] = [
+            (buffer, start, offset), (buffer, start + offset, length - offset)]
+        self.lengths[index:index + 1] = [offset, length - offset]
+        return index + 1
+
+    def get_text(self, start, length):
+        start, length = self._clamp(start, length)
+        index, offset = self._locate(start)
+        parts = []
+        while length > 0:
+            buffer, piece_start, piece_length = self.pieces[index]
+            take = min(piece_length - offset, length)
+            parts.append(buffer[piece_start + offset:piece_start + offset + take])
+            length -= take
+            index += 1
+            offset = 0
+        return "".join(parts)
+
+    def insert(self, start, text):
+        start, _ = self._clamp(start)
+        if not text:
+            return
+        index, offset = self._locate(start)
+        if offset == 0 and index:
+            # On a piece boundary, so the insert can extend the previous piece
+            index, offset = index - 1, self.lengths[index - 1]
+        if index < len(self.pieces) and self.lengths[index] + len(text) <= self.small_piece:
+            # Rebuild small pieces in place (e.g. while typing), to keep the piece count down
+            buffer, piece_start, piece_length = self.pieces[index]
+            piece = buffer[piece_start:piece_start + piece_length]
+            merged = piece[:offset] + text + piece[offset:]
+            self.pieces[index] = (merged, 0, len(merged))
+            self.lengths[index] = len(merged)
+        else:
+            index = self._split(start)
+            self.pieces.insert(index, (text, 0, len(text)))
+            self.lengths.insert(index, len(text))
+        self.length += len(text)
+        self._content = None
+
+    def delete(self, start, length):
+        start, length = self._clamp(start, length)
+        if not length:
+            return ""
+        first = self._split(start)
+        last = self._split(start + length)
+        deleted = self.pieces[first:last]
+        del self.pieces[first:last]
+        del self.lengths[first:last]
+        self.length -= length
+        self._content = None
+        return "".join(buffer[s:s + l] for buffer, s, l in deleted)
+
+    def replace(self, start, length, text):
+        start, length = self._clamp(start, length)
+        self.delete(start, length)
+        self.insert(start, text)
 
 
 class Command:
@@ -33,6 +216,29 @@ class Command:
     def undo(self):
         raise NotImplementedError
 
+    def merge(self, other):
+        # Absorb an already executed command into this one, returning True if merged
+        return False
+
+    def size(self):
+        return 0
+
+    def attach(self, editor):
+        self.editor = editor
+
+    def to_record(self):
+        record = {key: value for key, value in vars(self).items() if key != "editor"}
+        record["type"] = type(self).__name__
+        return record
+
+    @classmethod
+    def from_record(cls, editor, record):
+        command = cls.__new__(cls)
+        command.__dict__.update(record)
+        del command.type
+        command.editor = editor
+        return command
+
 
 class InsertText(Command):
 
@@ -42,18 +248,25 @@ class InsertText(Command):
         if start:
             self.start = start
         else:
-            self.start = len(self.editor.content)
+            self.start = len(self.editor)
 
     def execute(self):
-        self.editor.content = self.editor.content[:self.start] + \
-            self.input_text + self.editor.content[self.start:]
-        self.editor.print_content()
+        self.editor.insert(self.start, self.input_text)
+        self.editor.changed()
 
     def undo(self):
-        text_length = len(self.input_text)
-        self.editor.content = self.editor.content[:self.start] + \
-            self.editor.content[self.start + text_length:]
-        self.editor.print_content()
+        self.editor.delete(self.start, len(self.input_text))
+        self.editor.changed()
+
+    def merge(self, other):
+        if (type(other) is InsertText and other.editor is self.editor
+                and other.start == self.start + len(self.input_text)):
+            self.input_text += other.input_text
+            return True
+        return False
+
+    def size(self):
+        return len(self.input_text)
 
 
 class DeleteText(Command):
@@ -65,15 +278,30 @@ class DeleteText(Command):
         self.deleted_text = None
 
     def execute(self):
-        self.deleted_text = self.editor.content[self.start:self.start + self.length]
-        self.editor.content = self.editor.content[:self.start] + \
-            self.editor.content[self.start + self.length:]
-        self.editor.print_content()
+        self.deleted_text = self.editor.delete(self.start, self.length)
+        self.editor.changed()
 
     def undo(self):
-        self.editor.content = self.editor.content[:self.start] + \
-            self.deleted_text + self.editor.content[self.start:]
-        self.editor.print_content()
+        self.editor.insert(self.start, self.deleted_text)
+        self.editor.changed()
+
+    def merge(self, other):
+        if type(other) is not DeleteText or other.editor is not self.editor:
+            return False
+        if other.start == self.start:
+            # Forward delete
+            self.deleted_text += other.deleted_text
+        elif other.start + len(other.deleted_text) == self.start:
+            # Backspace
+            self.deleted_text = other.deleted_text + self.deleted_text
+            self.start = other.start
+        else:
+            return False
+        self.length = len(self.deleted_text)
+        return True
+
+    def size(self):
+        return len(self.deleted_text or "")
 
 
 class UpperText(Command):
@@ -85,34 +313,118 @@ class UpperText(Command):
         self.changed_text = ""
 
     def execute(self):
-        self.changed_text = self.editor.content[self.start:self.start + self.length]
-        self.editor.content = self.editor.content[:self.start] + \
-            self.changed_text.upper() + \
-            self.editor.content[self.start + self.length:]
-        self.editor.print_content()
+        self.changed_text = self.editor.get_text(self.start, self.length)
+        self.editor.replace(
+            self.start, len(self.changed_text), self.changed_text.upper())
+        self.editor.changed()
+
+    def undo(self):
+        self.editor.replace(
+            self.start, len(self.changed_text.upper()), self.changed_text)
+        self.editor.changed()
+
+    def size(self):
+        return len(self.changed_text)
+
+
+class _MacroBuffer(PieceTableTextEditor):
+    # Scratch editor a MacroCommand applies its batch to, which never renders
+    def __init__(self, content):
+        self.content = content
+        self.renderer = None
+        self.deferred = False
+        self.dirty = False
+
+
+class MacroCommand(Command):
+
+    def __init__(self, editor, commands):
+        self.editor = editor
+        self.commands = list(commands)
+
+    def _apply(self, commands, action):
+        # A list, as the commands are walked twice - the second time to point them back at the editor
+        commands = list(commands)
+        buffer = _MacroBuffer(self.editor.content)
+        try:
+            for command in commands:
+                command.editor = buffer
+                getattr(command, action)()
+        finally:
+            for command in commands:
+                command.editor = self.editor
+        # Only reached if every command succeeded, so a failure leaves the editor untouched
+        self.editor.content = buffer.content
+        self.editor.changed()
+
+    def execute(self):
+        self._apply(self.commands, "execute")
 
     def undo(self):
-        self.editor.content = self.editor.content[:self.start] + \
-            self.changed_text + self.editor.content[self.start + self.length:]
-        self.editor.print_content()
+        self._apply(reversed(self.commands), "undo")
+
+    def size(self):
+        return sum(command.size() for command in self.commands)
+
+    def attach(self, editor):
+        self.editor = editor
+        for command in self.commands:
+            command.attach(editor)
+
+    def to_record(self):
+        return {"type": "MacroCommand",
+                "commands": [command.to_record() for command in self.commands]}
+
+    @classmethod
+    def from_record(cls, editor, record):
+        return cls(editor, [command_from_record(editor, command)
+                            for command in record["commands"]])
+
+
+def command_from_record(editor, record):
+    return COMMAND_TYPES[record["type"]].from_record(editor, record)
 
 
 class Invoker:
 
-    def __init__(self):
+    def __init__(self, coalesce=False, max_commands=None, max_bytes=None, journal=None):
         self.undo_queue = deque()
         self.redo_queue = deque()
+        self.coalesce = coalesce
+        self.max_commands = max_commands
+        self.max_bytes = max_bytes
+        self.history_bytes = 0
+        self.journal = journal
 
     def execute_command(self, command):
         command.execute()
-        self.undo_queue.appendleft(command)
         self.redo_queue.clear()
+        previous = self.undo_queue[0] if self.undo_queue else None
+        previous_size = previous.size() if previous is not None else 0
+        if self.coalesce and previous is not None and previous.merge(command):
+            self.history_bytes += previous.size() - previous_size
+        else:
+            self.undo_queue.appendleft(command)
+            self.history_bytes += command.size()
+        self._trim_history()
+        if self.journal is not None:
+            self.journal.record(self, "execute", command)
+
+    def _trim_history(self):
+        # Drop the oldest commands until the history fits within its limits
+        while self.undo_queue and (
+                (self.max_commands is not None and len(self.undo_queue) > self.max_commands)
+                or (self.max_bytes is not None and self.history_bytes > self.max_bytes)):
+            self.history_bytes -= self.undo_queue.pop().size()
 
     def undo_command(self):
         if self.undo_queue:
             command = self.undo_queue.popleft()
+            self.history_bytes -= command.size()
             command.undo()
             self.redo_queue.appendleft(command)
+            if self.journal is not None:
+                self.journal.record(self, "undo", command)
         else:
             print("Nothing to undo")
 
@@ -121,10 +433,223 @@ class Invoker:
             command = self.redo_queue.popleft()
             command.execute()
             self.undo_queue.appendleft(command)
+            self.history_bytes += command.size()
+            self._trim_history()
+            if self.journal is not None:
+                self.journal.record(self, "redo", command)
         else:
             print("No commands to redo.")
 
 
+class ConcurrentInvoker:
+
+    def __init__(self, invoker, editor, max_batch=256):
+        self.invoker = invoker
+        self.editor = editor
+        self.max_batch = max_batch
+        self.submissions = queue.SimpleQueue()
+        self.closed = False
+        # Makes checking closed and queueing one step, so nothing can be queued after close()'s sentinel
+        self.lock = threading.Lock()
+        self.applier = threading.Thread(target=self._run_applier, daemon=True)
+        self.applier.start()
+
+    def _submit(self, operation, *args):
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("Cannot submit to a closed ConcurrentInvoker")
+            self.submissions.put((future, operation, args))
+        return future
+
+    def submit(self, command):
+        return self._submit(self.invoker.execute_command, command)
+
+    def undo(self):
+        return self._submit(self.invoker.undo_command)
+
+    def redo(self):
+        return self._submit(self.invoker.redo_command)
+
+    def submit_async(self, command):
+        return asyncio.wrap_future(self.submit(command))
+
+    def close(self):
+        # Everything already submitted is applied before the applier stops
+        with self.lock:
+            if not self.closed:
+                self.closed = True
+                self.submissions.put(None)
+        self.applier.join()
+
+    def _run_applier(self):
+        while True:
+            batch = [self.submissions.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.submissions.get_nowait())
+                except queue.Empty:
+                    break
+            with self.editor.deferred_rendering():
+                for submission in batch:
+                    if submission is None:
+                        continue
+                    future, operation, args = submission
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        future.set_result(operation(*args))
+                    except Exception as error:
+                        future.set_exception(error)
+            if None in batch:
+                return
+
+
+COMMAND_TYPES = {command_class.__name__: command_class
+                 for command_class in (InsertText, DeleteText, UpperText, MacroCommand)}
+
+
+class CommandJournal:
+
+    def __init__(self, path, editor, checkpoint_every=1000, checkpoint_history=1000, fsync=False):
+        self.path = path
+        self.checkpoint_path = path + ".checkpoint"
+        self.editor = editor
+        self.checkpoint_every = checkpoint_every
+        # Only the newest commands are written to a checkpoint, so its cost does not grow with the history
+        self.checkpoint_history = checkpoint_history
+        # Sync every record to disk, rather than leaving it to the OS
+        self.fsync = fsync
+        self.since_checkpoint = 0
+        self.file = open(path, "ab")
+
+    def record(self, invoker, operation, command=None):
+        entry = {"op": operation}
+        if command is not None:
+            entry["command"] = command.to_record()
+        self.file.write(json.dumps(entry).encode("utf-8") + b"\n")
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.since_checkpoint += 1
+        if self.since_checkpoint >= self.checkpoint_every:
+            self.checkpoint(invoker)
+
+    def checkpoint(self, invoker):
+        self.file.flush()
+        state = {
+            "offset": self.file.tell(),
+            "content": self.editor.content,
+            "undo": [command.to_record()
+                     for command in islice(invoker.undo_queue, self.checkpoint_history)],
+            "redo": [command.to_record()
+                     for command in islice(invoker.redo_queue, self.checkpoint_history)],
+        }
+        # Write then rename, so a crash mid-checkpoint leaves the previous one intact
+        temporary_path = self.checkpoint_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(state, file)
+            if self.fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temporary_path, self.checkpoint_path)
+        self.since_checkpoint = 0
+
+    def close(self):
+        self.file.close()
+
+    @classmethod
+    def recover(cls, path, editor, checkpoint_every=1000, checkpoint_history=1000, fsync=False,
+                **invoker_options):
+        buffer = _MacroBuffer("")
+        invoker = Invoker(**invoker_options)
+        offset = 0
+        if os.path.exists(path + ".checkpoint"):
+            with open(path + ".checkpoint", encoding="utf-8") as file:
+                state = json.load(file)
+            buffer.content = state["content"]
+            invoker.undo_queue.extend(
+                command_from_record(buffer, record) for record in state["undo"])
+            invoker.redo_queue.extend(
+                command_from_record(buffer, record) for record in state["redo"])
+            invoker.history_bytes = sum(command.size() for command in invoker.undo_queue)
+            offset = state["offset"]
+        if os.path.exists(path):
+            with open(path, "rb+") as file:
+                size = os.fstat(file.fileno()).st_size
+                file.seek(offset)
+                for line in file:
+                    try:
+                        # A record is only complete once its newline has been written
+                        entry = json.loads(line) if line.endswith(b"\n") else None
+                    except ValueError:
+                        entry = None
+                    if entry is None:
+                        if offset + len(line) < size:
+                            # Damage before the end is not a crash mid-write, so leave the journal alone
+                            raise ValueError(f"Corrupt journal record at byte {offset} of {path}")
+                        # A partly written final record from the crash - drop it
+                        file.truncate(offset)
+                        break
+                    offset += len(line)
+                    if entry["op"] == "execute":
+                        invoker.execute_command(
+                            command_from_record(buffer, entry["command"]))
+                    else:
+                        # Undo / redo the recorded command rather than the head of the recovered
+                        # history, which may be older than the history kept in the checkpoint
+                        command = command_from_record(buffer, entry["command"])
+                        if entry["op"] == "undo":
+                            if invoker.undo_queue:
+                                invoker.history_bytes -= invoker.undo_queue.popleft().size()
+                            command.undo()
+                            invoker.redo_queue.appendleft(command)
+                        else:
+                            if invoker.redo_queue:
+                                invoker.redo_queue.popleft()
+                            command.execute()
+                            invoker.undo_queue.appendleft(command)
+                            invoker.history_bytes += command.size()
+                            invoker._trim_history()
+        editor.content = buffer.content
+        for command in (*invoker.undo_queue, *invoker.redo_queue):
+            command.attach(editor)
+        invoker.journal = cls(path, editor, checkpoint_every, checkpoint_history, fsync)
+        editor.changed()
+        return invoker
+
+
+def benchmark_journal(commands=100_000, checkpoint_every=30_000):
+    # Journal a session of typing with an uncapped history, then time a replay from the last checkpoint and a full one
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "editor.journal")
+    buffer = _MacroBuffer("")
+    journal = CommandJournal(path, buffer, checkpoint_every=checkpoint_every)
+    journal_invoker = Invoker(journal=journal)
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for _ in range(commands):
+        if rng.random() < 0.9 or not len(buffer):
+            journal_invoker.execute_command(InsertText(buffer, "word ", len(buffer) + 1))
+        elif rng.random() < 0.5:
+            journal_invoker.execute_command(DeleteText(buffer, len(buffer) - 5, 5))
+        else:
+            journal_invoker.undo_command()
+    elapsed = time.perf_counter() - start
+    journal.close()
+    print(f"recording: {commands:,} commands journalled in {elapsed:.3f}s, checkpointing every {checkpoint_every:,}")
+    for label in ("replay from checkpoint", "full replay"):
+        if label == "full replay":
+            os.remove(path + ".checkpoint")
+        start = time.perf_counter()
+        recovered = CommandJournal.recover(path, _MacroBuffer(""))
+        elapsed = time.perf_counter() - start
+        recovered.journal.close()
+        assert recovered.journal.editor.content == buffer.content
+        print(f"{label}: {commands:,} journalled commands recovered in {elapsed:.3f}s")
+    shutil.rmtree(directory)
+
+
 invoker = Invoker()
 editor = TextEditor()
 
@@ -153,3 +678,137 @@ invoker.redo_command()
 
 print()
 editor.print_content()
+
+
+def benchmark_editors(document_size=2_000_000, edits=2000):
+    # Random inserts, deletes and upper-cases through the invoker on a large document
+    results = {}
+    for editor_class in (TextEditor, PieceTableTextEditor):
+        editor = editor_class("x" * document_size, renderer=None)  # Measure the edits, not the printing
+        invoker = Invoker()
+        rng = random.Random(0)
+        start = time.perf_counter()
+        for _ in range(edits):
+            position = rng.randrange(1, len(editor))
+            operation = rng.choice((InsertText, DeleteText, UpperText))
+            if operation is InsertText:
+                invoker.execute_command(InsertText(editor, "new text", position))
+            else:
+                invoker.execute_command(operation(editor, position, 8))
+        elapsed = time.perf_counter() - start
+        results[editor_class.__name__] = (editor.content, elapsed)
+        print(f"{editor_class.__name__}: {edits} edits on a {document_size:,} character document in {elapsed:.3f}s")
+    assert results["TextEditor"][0] == results["PieceTableTextEditor"][0]
+    return results
+
+
+# The same commands run against a piece table backed editor
+piece_table_invoker = Invoker()
+piece_table_editor = PieceTableTextEditor()
+piece_table_invoker.execute_command(
+    InsertText(piece_table_editor, "Here is some good starter text!"))
+piece_table_invoker.execute_command(InsertText(piece_table_editor, "very ", 13))
+piece_table_invoker.execute_command(UpperText(piece_table_editor, 13, 4))
+piece_table_invoker.undo_command()
+
+# Keystrokes coalesce into a single command, and history is capped at 10 commands
+typing_invoker = Invoker(coalesce=True, max_commands=10)
+typing_editor = TextEditor()
+for character in "Hello":
+    typing_invoker.execute_command(InsertText(typing_editor, character))
+print(len(typing_invoker.undo_queue))  # 1
+typing_invoker.undo_command()  # Removes the whole word
+
+# Find-and-replace applied as one macro - one rebuild and one render for the whole batch
+macro_editor = TextEditor("A cat sat on the mat with the hat")
+macro_invoker = Invoker()
+replacements = []
+position = macro_editor.content.rfind("the")
+# Work from the last match backwards, so earlier positions are not shifted by the edits
+while position != -1:
+    replacements.append(DeleteText(macro_editor, position, 3))
+    replacements.append(InsertText(macro_editor, "a", position))
+    position = macro_editor.content.rfind("the", 0, position)
+macro_invoker.execute_command(MacroCommand(macro_editor, replacements))
+macro_invoker.undo_command()  # A cat sat on the mat with the hat
+macro_invoker.redo_command()  # A cat sat on a mat with a hat
+
+# Journalled editing session - recover() rebuilds the content and history after a crash
+journal_directory = tempfile.mkdtemp()
+journal_path = os.path.join(journal_directory, "editor.journal")
+journal_editor = TextEditor()
+journal_invoker = Invoker(journal=CommandJournal(journal_path, journal_editor, checkpoint_every=2))
+journal_invoker.execute_command(InsertText(journal_editor, "Here is some text"))
+journal_invoker.execute_command(InsertText(journal_editor, " good", 12))
+journal_invoker.execute_command(UpperText(journal_editor, 13, 4))
+journal_invoker.undo_command()
+journal_invoker.journal.close()
+
+recovered_editor = TextEditor()
+recovered_invoker = CommandJournal.recover(journal_path, recovered_editor)  # Here is some good text
+recovered_invoker.redo_command()  # Here is some GOOD text
+recovered_invoker.journal.close()
+shutil.rmtree(journal_directory)
+
+# Deferred rendering - a burst of edits is drawn once, through a custom renderer
+frames = []
+deferred_editor = TextEditor(renderer=frames.append, deferred=True)
+deferred_invoker = Invoker()
+for word in ("Deferred ", "rendering ", "draws ", "once"):
+    deferred_invoker.execute_command(InsertText(deferred_editor, word))
+deferred_editor.render()
+print(frames)  # ['Deferred rendering draws once']
+
+with editor.deferred_rendering():
+    invoker.undo_command()
+    invoker.undo_command()  # Only the final state is printed, when the block exits
+
+# Concurrent submission - edits from many threads and asyncio tasks are applied in order by one thread
+shared_editor = TextEditor(renderer=None)
+concurrent_invoker = ConcurrentInvoker(Invoker(), shared_editor)
+writers = [threading.Thread(target=lambda: concurrent_invoker.submit(
+    InsertText(shared_editor, "x", 1)).result()) for _ in range(8)]
+for writer in writers:
+    writer.start()
+for writer in writers:
+    writer.join()
+
+
+async def submit_from_tasks():
+    await asyncio.gather(*(concurrent_invoker.submit_async(
+        InsertText(shared_editor, "y", 1)) for _ in range(8)))
+
+
+asyncio.run(submit_from_tasks())
+concurrent_invoker.close()
+print(len(shared_editor))  # 16
+
+
+def benchmark_concurrent_invoker(commands=20_000, producer_counts=(1, 2, 4, 8)):
+    for producers in producer_counts:
+        editor = PieceTableTextEditor(renderer=None)
+        concurrent_invoker = ConcurrentInvoker(Invoker(max_commands=1000), editor)
+        per_producer = commands // producers
+
+        def produce():
+            futures = [concurrent_invoker.submit(InsertText(editor, "x", 1))
+                       for _ in range(per_producer)]
+            for future in futures:
+                future.result()
+
+        threads = [threading.Thread(target=produce) for _ in range(producers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        concurrent_invoker.close()
+        assert len(editor) == per_producer * producers
+        print(f"{producers} producers: {per_producer * producers / elapsed:,.0f} commands/sec")
+
+
+if __name__ == "__main__":
+    benchmark_editors()
+    benchmark_journal()
+    benchmark_concurrent_invoker()
@@ -4,9 +4,34 @@ Iterator
 A behavioural design pattern that separates the iteration logic from the structure of the collection. The benefit of this, is that it allows for multiple simulataneous iterations of the underlying data structure to occur (each iterator maintains its own position within the collection). If you did not separate the iterator logic and defined __iter__ and __next__ inside the MyCollection class, all existing iter objects would progress each other's pointers each time next is called.
 
 It also means multiple different iteration strategies can be made available on the collection. See how an additional reverse iterator is created below. Note however that 'for' loops can only operate on the iterator defined in the __iter__ method.
+
+ChunkedIterator:
+- The element-wise iterators pay for a __next__, has_next and len() call per element, which dominates for numeric collections of millions of items. The chunked iterator hands out fixed-size blocks instead, forwards or in reverse. When the collection is backed by an array.array (or anything else supporting the buffer protocol), each block is a memoryview onto the underlying data, so nothing is copied. Lists fall back to list slices.
+
+Pipeline:
+- Chaining map() and filter() over iter(collection) pays per-element Python call overhead at every stage. MyCollection's map, filter, take, skip and batch methods instead build a lazy Pipeline, and nothing runs until it is iterated. At that point all of the stages are fused into a single generated loop (compiled once per sequence of stage kinds and cached). If NumPy is installed, the data is array-backed, and every map / filter stage (of which there must be at least one) was declared vectorised=True, the stages run over the whole array at once instead, with the results converted back to plain Python values and lists.
+
+MappedCollection:
+- A MyCollection whose data is a file of fixed-size records (described by a struct format) that is memory-mapped rather than read into memory. Opening takes constant time whatever the file size, and pages are only read in from disk as they are accessed. Single-value formats such as 'd' or 'q' are exposed as a cast memoryview over the mapping, so len, random access, the existing iterators and zero-copy chunks all work unchanged. Other formats (explicit byte order such as '<d', or several fields) go through a RecordView that unpacks records on access, returning plain values for single-field formats and tuples otherwise. A file that is not a whole number of records raises ValueError.
+
+ParallelIterator:
+- For CPU-heavy per-item work, the collection is split into index ranges which are handed to a pool of worker processes, and the results are streamed back either in order or as each partition completes. Array-backed data is copied once into shared memory (and MappedCollections are simply re-mapped from their file) so workers read it in place, rather than having their slice of the data pickled to them; other data is pickled per partition. The function must be picklable, i.e. defined at module level. The benchmarks and parallel examples at the bottom of this file sit under an if __name__ == "__main__" guard, as worker processes may re-import this module.
 '''
 
+import mmap
+import os
+import struct
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
 from abc import ABC, abstractmethod
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class Iterator(ABC):
@@ -55,6 +80,38 @@ class ReverseIterator(Iterator):
         return self.index >= 0
 
 
+class ChunkedIterator(Iterator):
+    def __init__(self, collection, chunk_size, reverse=False):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        try:
+            self.collection = memoryview(collection)
+        except TypeError:
+            # Not array-backed, so blocks are list slices rather than views
+            self.collection = collection
+        self.chunk_size = chunk_size
+        self.reverse = reverse
+        self.length = len(collection)
+        self.index = self.length if reverse else 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.has_next():
+            raise StopIteration
+        if self.reverse:
+            end = self.index
+            self.index = max(end - self.chunk_size, 0)
+            return self.collection[self.index:end][::-1]
+        start = self.index
+        self.index = min(start + self.chunk_size, self.length)
+        return self.collection[start:self.index]
+
+    def has_next(self):
+        return self.index > 0 if self.reverse else self.index < self.length
+
+
 class MyCollection:
 
     def __init__(self, data):
@@ -66,6 +123,307 @@ class MyCollection:
     def reverse_iterator(self):
         return ReverseIterator(self.data)
 
+    def chunks(self, chunk_size=4096, reverse=False):
+        return ChunkedIterator(self.data, chunk_size, reverse)
+
+    def pipeline(self):
+        return Pipeline(self.data)
+
+    def map(self, function, vectorised=False):
+        return self.pipeline().map(function, vectorised)
+
+    def filter(self, predicate, vectorised=False):
+        return self.pipeline().filter(predicate, vectorised)
+
+    def take(self, count):
+        return self.pipeline().take(count)
+
+    def skip(self, count):
+        return self.pipeline().skip(count)
+
+    def batch(self, size):
+        return self.pipeline().batch(size)
+
+    def parallel(self, function, partitions=None, processes=None, ordered=True):
+        return ParallelIterator(self, function, partitions, processes, ordered)
+
+
+class RecordView:
+    def __init__(self, buffer, record):
+        self.buffer = buffer
+        self.record = record
+        self.length = len(buffer) // record.size
+        # Single-field records are returned as the value itself rather than a 1-tuple
+        self.single = len(record.unpack(bytes(record.size))) == 1
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            if step == 1:
+                size = self.record.size
+                records = self.record.iter_unpack(self.buffer[start * size:max(stop, start) * size])
+                return [values[0] for values in records] if self.single else list(records)
+            return [self[i] for i in range(start, stop, step)]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("record index out of range")
+        values = self.record.unpack_from(self.buffer, index * self.record.size)
+        return values[0] if self.single else values
+
+
+class MappedCollection(MyCollection):
+
+    def __init__(self, path, record_format='d'):
+        self.record = struct.Struct(record_format)
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        if size % self.record.size:
+            self.file.close()
+            raise ValueError(f"{path} is {size} bytes, not a whole number of {self.record.size} byte records")
+        if size:
+            self.mapping = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # mmap cannot map an empty file
+            self.mapping = b''
+        self.buffer = memoryview(self.mapping)
+        try:
+            data = self.buffer.cast(record_format)
+        except (TypeError, ValueError):
+            data = RecordView(self.buffer, self.record)
+        super().__init__(data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        return self.data[index]
+
+    def close(self):
+        # Views onto the mapping must be released before it can be closed
+        if isinstance(self.data, memoryview):
+            self.data.release()
+        self.buffer.release()
+        if isinstance(self.mapping, mmap.mmap):
+            self.mapping.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def write(path, records, record_format='d'):
+        record = struct.Struct(record_format)
+        with open(path, 'wb') as file:
+            for values in records:
+                file.write(record.pack(*values) if isinstance(values, tuple) else record.pack(values))
+
+
+def _process_partition(source, start, stop, function):
+    # Runs in a worker process. source describes where to find the data
+    kind, details = source
+    if kind == "items":
+        return [function(item) for item in details]
+    if kind == "file":
+        with MappedCollection(*details) as mapped:
+            return [function(mapped[index]) for index in range(start, stop)]
+    name, record_format = details
+    block = shared_memory.SharedMemory(name=name)
+    view = block.buf.cast(record_format)
+    try:
+        return [function(item) for item in view[start:stop]]
+    finally:
+        view.release()
+        block.close()
+
+
+class ParallelIterator(Iterator):
+    def __init__(self, collection, function, partitions=None, processes=None, ordered=True):
+        self.collection = collection
+        self.function = function
+        self.processes = processes or os.cpu_count()
+        self.partitions = partitions or self.processes * 4
+        self.ordered = ordered
+        self.pending = []
+        self.results = self._run()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.has_next():
+            raise StopIteration
+        return self.pending.pop()
+
+    def has_next(self):
+        if not self.pending:
+            for item in self.results:
+                self.pending.append(item)
+                break
+        return bool(self.pending)
+
+    def _ranges(self, length):
+        size = max(-(-length // self.partitions), 1)
+        return [(start, min(start + size, length)) for start in range(0, length, size)]
+
+    def _run(self):
+        data = self.collection.data
+        block = None
+        if isinstance(self.collection, MappedCollection):
+            source = ("file", (self.collection.file.name, self.collection.record.format))
+        else:
+            try:
+                view = memoryview(data)
+            except TypeError:
+                view = None
+            if view is not None and view.nbytes:
+                # Copied into shared memory once, then read in place by every worker
+                block = shared_memory.SharedMemory(create=True, size=view.nbytes)
+                block.buf[:view.nbytes] = view.cast('B')
+                source = ("shared", (block.name, view.format))
+                view.release()
+            else:
+                source = None
+        try:
+            with ProcessPoolExecutor(self.processes) as pool:
+                futures = [pool.submit(_process_partition,
+                                       source or ("items", data[start:stop]),
+                                       start, stop, self.function)
+                           for start, stop in self._ranges(len(data))]
+                for future in (futures if self.ordered else as_completed(futures)):
+                    yield from future.result()
+        finally:
+            if block is not None:
+                block.close()
+                block.unlink()
+
+
+class Pipeline:
+    # Fused loops, keyed by the sequence of stage kinds they were generated for
+    compiled = {}
+
+    def __init__(self, source, stages=()):
+        self.source = source
+        self.stages = stages
+
+    def _then(self, kind, value, vectorised=False):
+        return Pipeline(self.source, self.stages + ((kind, value, vectorised),))
+
+    def map(self, function, vectorised=False):
+        return self._then("map", function, vectorised)
+
+    def filter(self, predicate, vectorised=False):
+        return self._then("filter", predicate, vectorised)
+
+    def take(self, count):
+        return self._then("take", count)
+
+    def skip(self, count):
+        return self._then("skip", count)
+
+    def batch(self, size):
+        if size < 1:
+            raise ValueError("batch size must be at least 1")
+        return self._then("batch", size)
+
+    def __iter__(self):
+        if self._can_vectorise():
+            return self._run_vectorised()
+        kinds = tuple(kind for kind, _, _ in self.stages)
+        if kinds not in Pipeline.compiled:
+            Pipeline.compiled[kinds] = Pipeline._compile(kinds)
+        return Pipeline.compiled[kinds](self.source, *(value for _, value, _ in self.stages))
+
+    def to_list(self):
+        return list(self)
+
+    @staticmethod
+    def _compile(kinds):
+        def body(stages, indent):
+            # The loop body for the given (index, kind) stages, ending in a yield
+            pad = " " * indent
+            lines = [f"{pad}if t{index} <= 0: break" for index, kind in stages if kind == "take"]
+            for index, kind in stages:
+                if kind == "map":
+                    lines.append(f"{pad}item = s{index}(item)")
+                elif kind == "filter":
+                    lines.append(f"{pad}if not s{index}(item): continue")
+                elif kind == "skip":
+                    lines.append(f"{pad}if k{index} > 0:")
+                    lines.append(f"{pad}    k{index} -= 1")
+                    lines.append(f"{pad}    continue")
+                elif kind == "take":
+                    lines.append(f"{pad}t{index} -= 1")
+                else:
+                    lines.append(f"{pad}b{index}.append(item)")
+                    lines.append(f"{pad}if len(b{index}) < s{index}: continue")
+                    lines.append(f"{pad}item, b{index} = b{index}, []")
+            lines.append(f"{pad}yield item")
+            return lines
+
+        stages = list(enumerate(kinds))
+        arguments = "".join(f", s{index}" for index, _ in stages)
+        lines = [f"def fused(source{arguments}):"]
+        for index, kind in stages:
+            if kind == "take":
+                lines.append(f"    t{index} = s{index}")
+            elif kind == "skip":
+                lines.append(f"    k{index} = s{index}")
+            elif kind == "batch":
+                lines.append(f"    b{index} = []")
+        lines.append("    for item in source:")
+        lines.extend(body(stages, 8))
+        # Partly filled batches are flushed through the stages after them once the source runs out
+        for position, (index, kind) in enumerate(stages):
+            if kind == "batch":
+                lines.append(f"    for item in ([b{index}] if b{index} else ()):")
+                lines.append(f"        b{index} = []")
+                lines.extend(body(stages[position + 1:], 8))
+        namespace = {}
+        exec("\n".join(lines), namespace)
+        return namespace["fused"]
+
+    def _can_vectorise(self):
+        if numpy is None:
+            return False
+        try:
+            memoryview(self.source)
+        except TypeError:
+            return False
+        requested = False
+        for position, (kind, _, vectorised) in enumerate(self.stages):
+            if kind in ("map", "filter"):
+                if not vectorised:
+                    return False
+                requested = True
+            if kind == "batch" and position != len(self.stages) - 1:
+                return False
+        # Only when a stage asked for it, so take / skip / batch alone behave the same with or without NumPy
+        return requested
+
+    def _run_vectorised(self):
+        values = numpy.asarray(memoryview(self.source))
+        for kind, value, _ in self.stages:
+            if kind == "map":
+                values = value(values)
+            elif kind == "filter":
+                values = values[value(values)]
+            elif kind == "take":
+                values = values[:max(value, 0)]
+            elif kind == "skip":
+                values = values[max(value, 0):]
+            else:
+                # Plain lists of Python values, the same as the fused loop produces
+                return iter([values[start:start + value].tolist()
+                             for start in range(0, len(values), value)])
+        return iter(values.tolist())
+
 
 collection = MyCollection([1, 2, 3, 4, 5])
 
@@ -87,3 +445,105 @@ print("Reverse Iterator")
 print(next(reverse_iterator))
 print(next(reverse_iterator))
 print(next(reverse_iterator))
+
+# Chunked iteration - blocks are zero-copy memoryviews over array-backed data
+numbers = MyCollection(array('d', range(10)))
+print("Chunked Iterator")
+for chunk in numbers.chunks(4):
+    print(chunk.tolist())  # [0.0, 1.0, 2.0, 3.0], [4.0, 5.0, 6.0, 7.0], [8.0, 9.0]
+for chunk in numbers.chunks(4, reverse=True):
+    print(chunk.tolist())  # [9.0, 8.0, 7.0, 6.0], [5.0, 4.0, 3.0, 2.0], [1.0, 0.0]
+
+
+def benchmark_iterators(size=2_000_000, chunk_size=65536):
+    large = MyCollection(array('d', range(size)))
+    start = time.perf_counter()
+    total = sum(large)
+    element_wise = time.perf_counter() - start
+    start = time.perf_counter()
+    chunked_total = sum(sum(chunk) for chunk in large.chunks(chunk_size))
+    chunked = time.perf_counter() - start
+    assert total == chunked_total
+    print(f"Element-wise: {element_wise:.3f}s, chunked: {chunked:.3f}s for {size:,} items")
+    start = time.perf_counter()
+    stages = sum(map(lambda x: x * 2, filter(lambda x: x % 3 == 0, large)))
+    chained = time.perf_counter() - start
+    start = time.perf_counter()
+    fused = sum(large.filter(lambda x: x % 3 == 0).map(lambda x: x * 2))
+    pipeline = time.perf_counter() - start
+    assert stages == fused
+    print(f"Chained map / filter: {chained:.3f}s, fused pipeline: {pipeline:.3f}s")
+    if numpy is not None:
+        start = time.perf_counter()
+        whole_array = sum(large.filter(lambda x: x % 3 == 0, vectorised=True)
+                          .map(lambda x: x * 2, vectorised=True))
+        vectorised = time.perf_counter() - start
+        assert whole_array == fused
+        print(f"Vectorised pipeline: {vectorised:.3f}s")
+
+
+# Lazy pipeline - nothing runs until it is iterated, then the stages run as one loop
+evens_doubled = collection.filter(lambda x: x % 2 == 0).map(lambda x: x * 2)
+print("Pipeline")
+print(evens_doubled.to_list())  # [4, 8]
+print(MyCollection(list(range(10))).skip(1).take(7).batch(3).to_list())  # [[1, 2, 3], [4, 5, 6], [7]]
+measurements = MyCollection(array('d', range(10)))
+fused_result = measurements.filter(lambda x: x % 3 == 0).map(lambda x: x * 2).batch(2).to_list()
+vectorised_result = (measurements.filter(lambda x: x % 3 == 0, vectorised=True)
+                     .map(lambda x: x * 2, vectorised=True).batch(2).to_list())
+print(vectorised_result, vectorised_result == fused_result)  # [[0.0, 6.0], [12.0, 18.0]] True, with or without NumPy
+
+
+def benchmark_mapped_open(size_gb=4):
+    # A sparse file, so creating it is instant - opening it should be too
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'large.bin')
+        with open(path, 'wb') as file:
+            file.truncate(size_gb * 1024 ** 3)
+        start = time.perf_counter()
+        with MappedCollection(path, 'd') as mapped:
+            opened = time.perf_counter() - start
+            print(f"Opened {len(mapped):,} records ({size_gb} GB) in {opened * 1000:.2f}ms, "
+                  f"last record: {mapped[len(mapped) - 1]}")
+
+
+# Memory-mapped collection - records are paged in from disk as they are used
+with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'records.bin')
+    MappedCollection.write(path, range(10), 'q')
+    with MappedCollection(path, 'q') as mapped:
+        print("Mapped Collection")
+        print(len(mapped), mapped[3])  # 10 3
+        print(next(mapped.reverse_iterator()))  # 9
+        print([chunk.tolist() for chunk in mapped.chunks(4)])  # [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+    MappedCollection.write(path, [(1, 2.5), (2, 5.0)], 'qd')
+    with MappedCollection(path, 'qd') as mapped:
+        print(list(mapped.chunks(1)))  # [[(1, 2.5)], [(2, 5.0)]]
+
+
+def cpu_heavy(value):
+    return sum(i * i for i in range(int(value) % 100 + 2000))
+
+
+def benchmark_parallel(size=5_000):
+    data = MyCollection(array('d', range(size)))
+    start = time.perf_counter()
+    expected = [cpu_heavy(value) for value in data]
+    print(f"Sequential: {time.perf_counter() - start:.3f}s")
+    for processes in sorted({1, 2, 4, os.cpu_count()}):
+        start = time.perf_counter()
+        results = list(data.parallel(cpu_heavy, processes=processes))
+        assert results == expected
+        print(f"{processes} processes: {time.perf_counter() - start:.3f}s")
+
+
+if __name__ == "__main__":
+    benchmark_iterators()
+    benchmark_mapped_open()
+
+    # Parallel iteration - partitions are processed in worker processes and streamed back in order
+    print("Parallel Iterator")
+    print(list(MyCollection(array('q', range(10))).parallel(abs, partitions=3)))  # [0, 1, ..., 9]
+    print(sorted(MyCollection([-1, -2, -3]).parallel(abs, ordered=False)))  # [1, 2, 3]
+    benchmark_parallel()
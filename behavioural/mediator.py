@@ -6,8 +6,27 @@ College objects interact with each other through a mediator object, rather than
 Mediator vs Observer
 - The mediator is an object attached as a plug-in to facilitate communication between two or more objects that don't have any knowledge of each other. The users are still the ones that initiate communication.
 - Observer is a subscriber / messaging system, where the observer initiates communication with the subscribers. There are no properties on the user objects to indicate which observers they are subscribed to. They also cannot initiate communication.
+
+RoomChatMediator:
+- ChatRoomMediator walks every registered colleague for every message. The room mediator keeps an index from each room to its members (and from each colleague to its rooms), using dicts so joining and leaving are O(1). A message sent to a room is only delivered to that room's members, so the cost of sending depends on the size of the room rather than the total number of colleagues.
+
+AsyncChatRoomMediator:
+- With ChatRoomMediator, receive_message runs inside the sender's send() call, so one slow receiver stalls everyone. In the asyncio version each AsyncColleague has a bounded inbox and its own consumer task, and sending only places the message in each inbox. When an inbox is full, the mediator's overflow policy decides what happens: "block" waits for space, "drop_oldest" discards the oldest queued message, and "disconnect" removes the slow colleague. Disconnecting a colleague discards its queued messages, so a sender blocked on its full inbox is released rather than waiting forever. queue_depths() reports each colleague's current inbox depth, and each colleague counts its received, dropped and max_depth. An exception raised by receive_message is counted in errors (with the latest kept in last_error) rather than stopping the colleague's consumer task.
+
+DistributedChatRoomMediator:
+- Spreads colleagues across several worker processes, each with its own mediator. Local deliveries stay in-process, and every message is also sent once to each other worker over a local Unix socket, where that worker's mediator delivers it to its own colleagues. Messages are framed in a compact binary format: a fixed header (frame length, send time in nanoseconds, sender name length) followed by the UTF-8 sender name and message. The send time lets receiving workers measure delivery latency. Local sends and the reader thread for each peer deliver under one lock per worker, so colleagues are never called concurrently, and an exception from a colleague is counted (errors, last_error) rather than ending the reader thread. The benchmarks and the asyncio and Unix socket examples at the bottom of this file sit under an if __name__ == "__main__" guard, as worker processes may re-import this module (and Unix sockets are not available everywhere).
 '''
 
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import struct
+import tempfile
+import threading
+import time
+
 
 class Mediator:
     def register_colleague(self, colleague):
@@ -30,18 +49,295 @@ class ChatRoomMediator(Mediator):
                 colleague.receive_message(message)
 
 
+class RoomChatMediator(Mediator):
+    def __init__(self):
+        # Dicts rather than sets, so members are delivered to in the order they joined
+        self.rooms = {}
+        self.memberships = {}
+
+    def register_colleague(self, colleague):
+        self.memberships.setdefault(colleague, {})
+
+    def unregister_colleague(self, colleague):
+        for room in list(self.memberships.get(colleague, ())):
+            self.leave(colleague, room)
+        self.memberships.pop(colleague, None)
+
+    def join(self, colleague, room):
+        self.rooms.setdefault(room, {})[colleague] = None
+        self.memberships.setdefault(colleague, {})[room] = None
+
+    def leave(self, colleague, room):
+        members = self.rooms.get(room)
+        if members is None or colleague not in members:
+            return
+        del members[colleague]
+        del self.memberships[colleague][room]
+        if not members:
+            del self.rooms[room]
+
+    def send_message(self, message, sender, room=None):
+        # Without a room, the message goes to every room the sender is in
+        rooms = self.memberships.get(sender, {}) if room is None else (room,)
+        delivered = set()
+        for room in rooms:
+            for colleague in self.rooms.get(room, ()):
+                if colleague is not sender and colleague not in delivered:
+                    delivered.add(colleague)
+                    colleague.receive_message(message)
+
+
 class Colleague:
     def __init__(self, name, mediator):
         self.name = name
         self.mediator = mediator
 
-    def send(self, message):
-        self.mediator.send_message(message, self)
+    def send(self, message, room=None):
+        if room is None:
+            self.mediator.send_message(message, self)
+        else:
+            self.mediator.send_message(message, self, room)
+
+    def join(self, room):
+        self.mediator.join(self, room)
+
+    def leave(self, room):
+        self.mediator.leave(self, room)
 
     def receive_message(self, message):
         print(f"{self.name} received message: {message}")
 
 
+class AsyncChatRoomMediator(Mediator):
+    overflow_policies = ("block", "drop_oldest", "disconnect")
+
+    def __init__(self, inbox_size=100, overflow="block"):
+        if overflow not in self.overflow_policies:
+            raise ValueError(f"overflow must be one of {self.overflow_policies}")
+        self.inbox_size = inbox_size
+        self.overflow = overflow
+        self.colleagues = {}
+
+    def register_colleague(self, colleague):
+        # Must be called from a running event loop, as it starts the colleague's consumer task
+        colleague.connect(self.inbox_size)
+        self.colleagues[colleague] = None
+
+    def disconnect(self, colleague):
+        if self.colleagues.pop(colleague, False) is None:
+            colleague.disconnect()
+
+    async def send_message(self, message, sender):
+        for colleague in list(self.colleagues):
+            # Skips colleagues disconnected while an earlier put was waiting
+            if colleague is sender or colleague not in self.colleagues:
+                continue
+            inbox = colleague.inbox
+            if inbox.full():
+                if self.overflow == "block":
+                    await inbox.put(message)
+                    if colleague.consumer is None:
+                        # Disconnected while waiting - nothing will read this, so let the next waiter in
+                        colleague.drain()
+                    continue
+                if self.overflow == "disconnect":
+                    self.disconnect(colleague)
+                    continue
+                inbox.get_nowait()
+                inbox.task_done()
+                colleague.dropped += 1
+            inbox.put_nowait(message)
+            colleague.max_depth = max(colleague.max_depth, inbox.qsize())
+
+    def queue_depths(self):
+        return {colleague.name: colleague.inbox.qsize() for colleague in self.colleagues}
+
+    async def close(self):
+        # Let every inbox drain, then stop the consumers
+        await asyncio.gather(*(colleague.inbox.join() for colleague in self.colleagues))
+        for colleague in list(self.colleagues):
+            self.disconnect(colleague)
+
+
+class AsyncColleague(Colleague):
+    def __init__(self, name, mediator):
+        super().__init__(name, mediator)
+        self.inbox = None
+        self.consumer = None
+        self.received = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_error = None
+        self.max_depth = 0
+
+    def connect(self, inbox_size):
+        self.inbox = asyncio.Queue(inbox_size)
+        self.consumer = asyncio.get_running_loop().create_task(self._consume())
+
+    def disconnect(self):
+        if self.consumer is not None:
+            self.consumer.cancel()
+            self.consumer = None
+            self.drain()
+
+    def drain(self):
+        # Discard whatever is queued, which also wakes any sender blocked on a full inbox
+        while not self.inbox.empty():
+            self.inbox.get_nowait()
+            self.inbox.task_done()
+            self.dropped += 1
+
+    async def send(self, message):
+        await self.mediator.send_message(message, self)
+
+    async def receive_message(self, message):
+        print(f"{self.name} received message: {message}")
+
+    async def _consume(self):
+        while True:
+            message = await self.inbox.get()
+            try:
+                await self.receive_message(message)
+                self.received += 1
+            except Exception as exception:
+                # Counted rather than raised, so the consumer task keeps draining the inbox
+                self.errors += 1
+                self.last_error = exception
+            finally:
+                self.inbox.task_done()
+
+
+# Frame length (excluding this header), send time in nanoseconds, sender name length
+FRAME_HEADER = struct.Struct("!IQH")
+
+
+def encode_frame(sender_name, message, sent_ns):
+    name = sender_name.encode("utf-8")
+    body = name + message.encode("utf-8")
+    return FRAME_HEADER.pack(len(body), sent_ns, len(name)) + body
+
+
+def decode_frames(buffer):
+    # Yields (sender name, message, send time) for each complete frame, and the unconsumed remainder
+    frames = []
+    offset = 0
+    while len(buffer) - offset >= FRAME_HEADER.size:
+        length, sent_ns, name_length = FRAME_HEADER.unpack_from(buffer, offset)
+        start = offset + FRAME_HEADER.size
+        if len(buffer) - start < length:
+            break
+        name = bytes(buffer[start:start + name_length]).decode("utf-8")
+        message = bytes(buffer[start + name_length:start + length]).decode("utf-8")
+        frames.append((name, message, sent_ns))
+        offset = start + length
+    return frames, buffer[offset:]
+
+
+class DistributedChatRoomMediator(Mediator):
+    def __init__(self, worker_id, addresses):
+        self.worker_id = worker_id
+        self.addresses = addresses
+        self.colleagues = []
+        self.peers = {}
+        self.peer_locks = {}
+        self.listener = None
+        self.threads = []
+        self.frames_received = 0
+        self.latencies_ns = []
+        self.errors = 0
+        self.last_error = None
+        self.received = threading.Condition()
+        # Local sends and every peer reader deliver under this, so colleagues never see concurrent calls
+        self.delivery_lock = threading.Lock()
+
+    def register_colleague(self, colleague):
+        self.colleagues.append(colleague)
+
+    def start(self, timeout=10.0):
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.addresses[self.worker_id])
+        self.listener.listen()
+        self._start_thread(self._accept_peers)
+        deadline = time.monotonic() + timeout
+        for peer_id, address in enumerate(self.addresses):
+            if peer_id == self.worker_id:
+                continue
+            while True:
+                # Peers may not be listening yet
+                try:
+                    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    connection.connect(address)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    connection.close()
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.01)
+            self.peers[peer_id] = connection
+            self.peer_locks[peer_id] = threading.Lock()
+
+    def _start_thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def _accept_peers(self):
+        for _ in range(len(self.addresses) - 1):
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                return
+            self._start_thread(self._read_peer, connection)
+
+    def _read_peer(self, connection):
+        buffer = b""
+        with connection:
+            while True:
+                data = connection.recv(1 << 16)
+                if not data:
+                    return
+                frames, buffer = decode_frames(buffer + data)
+                received_ns = time.monotonic_ns()
+                for _, message, sent_ns in frames:
+                    self._deliver(message)
+                    with self.received:
+                        self.frames_received += 1
+                        self.latencies_ns.append(received_ns - sent_ns)
+                        self.received.notify_all()
+
+    def _deliver(self, message, sender=None):
+        with self.delivery_lock:
+            for colleague in self.colleagues:
+                if colleague is sender:
+                    continue
+                try:
+                    colleague.receive_message(message)
+                except Exception as exception:
+                    # Counted rather than raised, so one failing colleague neither kills a reader thread nor starves the others
+                    self.errors += 1
+                    self.last_error = exception
+
+    def send_message(self, message, sender):
+        self._deliver(message, sender)
+        if self.peers:
+            frame = encode_frame(sender.name, message, time.monotonic_ns())
+            for peer_id, connection in self.peers.items():
+                with self.peer_locks[peer_id]:
+                    connection.sendall(frame)
+
+    def wait_for(self, frames, timeout=None):
+        # Wait until this worker has received the given number of frames from its peers
+        with self.received:
+            return self.received.wait_for(lambda: self.frames_received >= frames, timeout)
+
+    def close(self):
+        for connection in self.peers.values():
+            connection.close()
+        if self.listener is not None:
+            self.listener.close()
+            os.unlink(self.addresses[self.worker_id])
+
+
 mediator = ChatRoomMediator()
 
 colleague1 = Colleague("John", mediator)
@@ -52,3 +348,140 @@ mediator.register_colleague(colleague2)
 
 colleague1.send("Hello, Alice!")
 colleague2.send("Hi, John!")
+
+# Rooms - messages are only delivered to the members of the target room
+room_mediator = RoomChatMediator()
+bob = Colleague("Bob", room_mediator)
+carol = Colleague("Carol", room_mediator)
+dave = Colleague("Dave", room_mediator)
+bob.join("python")
+carol.join("python")
+dave.join("rust")
+bob.send("Anyone using 3.12?", "python")  # Carol received message: Anyone using 3.12?
+carol.leave("python")
+bob.send("Hello?", "python")  # Nobody else is in the room
+
+
+class CountingColleague(Colleague):
+    received = 0
+
+    def receive_message(self, message):
+        CountingColleague.received += 1
+
+
+def benchmark_mediators(colleague_count=100_000, room_count=10_000, messages=10_000):
+    rng = random.Random(0)
+    flat_mediator = ChatRoomMediator()
+    rooms_mediator = RoomChatMediator()
+    flat = [CountingColleague(str(i), flat_mediator) for i in range(colleague_count)]
+    roomed = [CountingColleague(str(i), rooms_mediator) for i in range(colleague_count)]
+    for colleague in flat:
+        flat_mediator.register_colleague(colleague)
+    start = time.perf_counter()
+    for i, colleague in enumerate(roomed):
+        colleague.join(i % room_count)
+    print(f"{colleague_count:,} joins across {room_count:,} rooms: {time.perf_counter() - start:.3f}s")
+
+    # The flat mediator is far slower, so it only sends a handful of messages
+    flat_messages = 10
+    start = time.perf_counter()
+    for _ in range(flat_messages):
+        rng.choice(flat).send("Hello")
+    flat_rate = flat_messages / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(messages):
+        sender = rng.choice(roomed)
+        sender.send("Hello", next(iter(sender.mediator.memberships[sender])))
+    room_rate = messages / (time.perf_counter() - start)
+    print(f"ChatRoomMediator: {flat_rate:,.0f} messages/sec, RoomChatMediator: {room_rate:,.0f} messages/sec")
+
+
+# asyncio mediator - a slow receiver has messages dropped rather than holding up the sender
+class SlowColleague(AsyncColleague):
+    async def receive_message(self, message):
+        await asyncio.sleep(0.01)
+        print(f"{self.name} (slowly) received message: {message}")
+
+
+async def async_chat():
+    async_mediator = AsyncChatRoomMediator(inbox_size=2, overflow="drop_oldest")
+    erin = AsyncColleague("Erin", async_mediator)
+    frank = SlowColleague("Frank", async_mediator)
+    async_mediator.register_colleague(erin)
+    async_mediator.register_colleague(frank)
+    for i in range(5):
+        await erin.send(f"Update {i}")
+    print(async_mediator.queue_depths())  # {'Erin': 0, 'Frank': 2}
+    await async_mediator.close()  # Frank received message: Update 3, Update 4
+    print(f"Frank received {frank.received}, dropped {frank.dropped}")  # received 2, dropped 3
+
+
+# Distributed mediator - two workers (threads here, processes in the benchmark) linked by Unix sockets
+def distributed_chat():
+    socket_directory = tempfile.mkdtemp()
+    addresses = [os.path.join(socket_directory, f"worker-{i}.sock") for i in range(2)]
+    workers = [DistributedChatRoomMediator(i, addresses) for i in range(2)]
+    grace = Colleague("Grace", workers[0])
+    heidi = Colleague("Heidi", workers[1])
+    workers[0].register_colleague(grace)
+    workers[1].register_colleague(heidi)
+    starters = [threading.Thread(target=worker.start) for worker in workers]
+    for starter in starters:
+        starter.start()
+    for starter in starters:
+        starter.join()
+    grace.send("Hello from worker 0")
+    workers[1].wait_for(1, timeout=5)  # Heidi received message: Hello from worker 0
+    for worker in workers:
+        worker.close()
+    os.rmdir(socket_directory)
+
+
+def distributed_worker(worker_id, addresses, colleague_count, messages, barrier, results):
+    worker_mediator = DistributedChatRoomMediator(worker_id, addresses)
+    for i in range(colleague_count):
+        worker_mediator.register_colleague(CountingColleague(f"{worker_id}-{i}", worker_mediator))
+    worker_mediator.start()
+    barrier.wait()
+    sender = worker_mediator.colleagues[0]
+    start = time.perf_counter()
+    for i in range(messages):
+        sender.send("Hello")
+    worker_mediator.wait_for(messages * (len(addresses) - 1))
+    elapsed = time.perf_counter() - start
+    barrier.wait()
+    worker_mediator.close()
+    latencies = sorted(worker_mediator.latencies_ns) or [0]
+    results.put((elapsed, latencies[len(latencies) // 2], latencies[len(latencies) * 99 // 100]))
+
+
+def benchmark_distributed(worker_counts=(1, 2, 4, 8), colleague_count=100, messages=2_000):
+    for worker_count in worker_counts:
+        directory = tempfile.mkdtemp()
+        addresses = [os.path.join(directory, f"worker-{i}.sock") for i in range(worker_count)]
+        barrier = multiprocessing.Barrier(worker_count)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(
+            target=distributed_worker,
+            args=(i, addresses, colleague_count, messages, barrier, results))
+            for i in range(worker_count)]
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        os.rmdir(directory)
+        elapsed = max(outcome[0] for outcome in outcomes)
+        # Every message reaches every colleague bar its sender, across all workers
+        deliveries = worker_count * messages * (worker_count * colleague_count - 1)
+        median = max(outcome[1] for outcome in outcomes) / 1000
+        p99 = max(outcome[2] for outcome in outcomes) / 1000
+        print(f"{worker_count} workers: {worker_count * messages / elapsed:,.0f} messages/sec "
+              f"({deliveries / elapsed:,.0f} deliveries/sec), latency median {median:,.0f}us, p99 {p99:,.0f}us")
+
+
+if __name__ == "__main__":
+    benchmark_mediators()
+    asyncio.run(async_chat())
+    distributed_chat()
+    benchmark_distributed()
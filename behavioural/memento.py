@@ -9,8 +9,25 @@ Implementation:
 
 Example:
 An example could be to add the ability for a text editor to save a version of itself. It could then revert back to this previous version if needed.
+
+DeltaCaretaker:
+- The plain Caretaker holds a full copy of the content for every memento, so memory grows by the document size on every save. The delta caretaker stores a full keyframe every keyframe_interval snapshots, and in between only the difference from the previous snapshot (the length of the common prefix and suffix, plus the replaced middle text). get_memento(index) starts from the nearest keyframe at or before index and applies at most keyframe_interval - 1 deltas, so restoring any version takes bounded time.
+
+SpillingCaretaker:
+- Keeps the most recent mementos in memory up to memory_budget bytes of content. Older mementos are spilled, as UTF-8, to a single append-only temporary file, and only their offset and length are kept in memory. get_memento(index) works the same either way: spilled mementos are read back through a memory map of the file. hits, spills and reloads count what happened.
+
+DedupCaretaker:
+- Editors often save the same state more than once, for example after undoing back to an earlier version. The dedup caretaker stores each distinct content once, keyed by its SHA-256 hash, and the history itself is just a list of hashes. Payloads are reference counted, so when trim() drops old history, any payload no longer referenced is freed.
 '''
 
+import hashlib
+import mmap
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
 
 class TextEditorMemento:
     def __init__(self, content):
@@ -45,6 +62,152 @@ class Caretaker:
         return self.mementos[index]
 
 
+def _longest_match(matches, limit):
+    # Binary search for the longest length that matches, comparing slices rather than characters
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if matches(middle):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def diff(old, new):
+    # The common prefix and suffix lengths, and the text that replaces what lies between them in old
+    limit = min(len(old), len(new))
+    prefix = _longest_match(lambda length: old[:length] == new[:length], limit)
+    suffix = _longest_match(
+        lambda length: old[len(old) - length:] == new[len(new) - length:], limit - prefix)
+    return prefix, suffix, new[prefix:len(new) - suffix]
+
+
+def apply_diff(old, delta):
+    prefix, suffix, text = delta
+    return old[:prefix] + text + old[len(old) - suffix:]
+
+
+class DeltaCaretaker:
+    def __init__(self, keyframe_interval=16):
+        self.keyframe_interval = keyframe_interval
+        # Full content for keyframes, (prefix, suffix, text) deltas for everything else
+        self.snapshots = []
+        self.last_content = None
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def add_memento(self, memento):
+        content = memento.get_content()
+        if len(self.snapshots) % self.keyframe_interval == 0:
+            self.snapshots.append(content)
+        else:
+            self.snapshots.append(diff(self.last_content, content))
+        self.last_content = content
+
+    def get_memento(self, index):
+        if index < 0:
+            index += len(self.snapshots)
+        if not 0 <= index < len(self.snapshots):
+            raise IndexError("memento index out of range")
+        keyframe = index - index % self.keyframe_interval
+        content = self.snapshots[keyframe]
+        for delta in self.snapshots[keyframe + 1:index + 1]:
+            content = apply_diff(content, delta)
+        return TextEditorMemento(content)
+
+
+class SpillingCaretaker:
+    def __init__(self, memory_budget=64 * 1024 ** 2, directory=None):
+        self.memory_budget = memory_budget
+        # A TextEditorMemento while in memory, an (offset, length) pair once spilled
+        self.mementos = []
+        self.oldest_in_memory = 0
+        self.memory_used = 0
+        self.spill_file = tempfile.TemporaryFile(dir=directory)
+        self.spill_size = 0
+        self.mapping = None
+        self.hits = 0
+        self.spills = 0
+        self.reloads = 0
+
+    def __len__(self):
+        return len(self.mementos)
+
+    def add_memento(self, memento):
+        self.mementos.append(memento)
+        self.memory_used += sys.getsizeof(memento.get_content())
+        while self.memory_used > self.memory_budget and self.oldest_in_memory < len(self.mementos) - 1:
+            self._spill(self.oldest_in_memory)
+            self.oldest_in_memory += 1
+
+    def _spill(self, index):
+        content = self.mementos[index].get_content()
+        data = content.encode("utf-8")
+        self.spill_file.seek(self.spill_size)
+        self.spill_file.write(data)
+        self.mementos[index] = (self.spill_size, len(data))
+        self.spill_size += len(data)
+        self.memory_used -= sys.getsizeof(content)
+        self.spills += 1
+
+    def get_memento(self, index):
+        memento = self.mementos[index]
+        if isinstance(memento, TextEditorMemento):
+            self.hits += 1
+            return memento
+        offset, length = memento
+        self.reloads += 1
+        if not length:
+            # Nothing was written for an empty memento, and an empty spill file cannot be mapped
+            return TextEditorMemento("")
+        if self.mapping is None or len(self.mapping) < offset + length:
+            # The file has grown since it was last mapped
+            self.spill_file.flush()
+            if self.mapping is not None:
+                self.mapping.close()
+            self.mapping = mmap.mmap(self.spill_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return TextEditorMemento(self.mapping[offset:offset + length].decode("utf-8"))
+
+    def close(self):
+        if self.mapping is not None:
+            self.mapping.close()
+        self.spill_file.close()
+
+
+class DedupCaretaker:
+    def __init__(self):
+        self.hashes = []
+        self.payloads = {}
+        self.references = {}
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def add_memento(self, memento):
+        content = memento.get_content()
+        key = hashlib.sha256(content.encode("utf-8")).digest()
+        if key not in self.payloads:
+            self.payloads[key] = content
+            self.references[key] = 0
+        self.references[key] += 1
+        self.hashes.append(key)
+
+    def get_memento(self, index):
+        return TextEditorMemento(self.payloads[self.hashes[index]])
+
+    def trim(self, keep):
+        # Drop all but the newest keep mementos, freeing payloads nothing refers to any more
+        dropped = self.hashes[:max(len(self.hashes) - keep, 0)]
+        del self.hashes[:len(dropped)]
+        for key in dropped:
+            self.references[key] -= 1
+            if not self.references[key]:
+                del self.references[key]
+                del self.payloads[key]
+
+
 editor = TextEditor()
 caretaker = Caretaker()
 
@@ -64,3 +227,58 @@ print(editor.content)  # Output: Python is awesome!
 # Perform redo
 editor.restore_from_memento(caretaker.get_memento(2))
 print(editor.content)  # Output: Design patterns in Python
+
+
+# Spilling caretaker - only the most recent mementos are kept in memory
+spilling_caretaker = SpillingCaretaker(memory_budget=200)
+for version in range(5):
+    editor.set_content(f"Version {version}")
+    spilling_caretaker.add_memento(editor.create_memento())
+print(spilling_caretaker.get_memento(0).get_content())  # Version 0, reloaded from disk
+print(spilling_caretaker.get_memento(-1).get_content())  # Version 4, still in memory
+print(spilling_caretaker.spills, spilling_caretaker.hits, spilling_caretaker.reloads)  # 2 1 1
+spilling_caretaker.close()
+
+# Dedup caretaker - repeated states share one stored payload
+dedup_caretaker = DedupCaretaker()
+for content in ("Draft", "Draft v2", "Draft", "Draft v2", "Final"):
+    editor.set_content(content)
+    dedup_caretaker.add_memento(editor.create_memento())
+print(len(dedup_caretaker), len(dedup_caretaker.payloads))  # 5 3
+dedup_caretaker.trim(2)
+print(dedup_caretaker.get_memento(0).get_content(), len(dedup_caretaker.payloads))  # Draft v2 2
+
+# Delta caretaker - only changes are stored between keyframes
+delta_caretaker = DeltaCaretaker(keyframe_interval=2)
+for content in ("Hello, world!", "Hello, world! Bye.", "Hello, there! Bye."):
+    editor.set_content(content)
+    delta_caretaker.add_memento(editor.create_memento())
+print(delta_caretaker.snapshots[1])  # (13, 0, ' Bye.')
+editor.restore_from_memento(delta_caretaker.get_memento(1))
+print(editor.content)  # Output: Hello, world! Bye.
+
+
+def benchmark_caretakers(document_size=100_000, snapshots=500, keyframe_interval=16):
+    for caretaker_class in (Caretaker, DeltaCaretaker):
+        rng = random.Random(0)
+        content = "x" * document_size
+        tracemalloc.start()
+        history = DeltaCaretaker(keyframe_interval) if caretaker_class is DeltaCaretaker else Caretaker()
+        for _ in range(snapshots):
+            position = rng.randrange(len(content))
+            # Build a new string, as an editor would, rather than sharing the old one
+            content = content[:position] + "edit" + content[position + 4:]
+            history.add_memento(TextEditorMemento(content))
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        start = time.perf_counter()
+        for index in range(snapshots):
+            history.get_memento(index)
+        restore = (time.perf_counter() - start) / snapshots
+        assert history.get_memento(snapshots - 1).get_content() == content
+        print(f"{caretaker_class.__name__}: {memory / 1024 ** 2:.1f} MB for {snapshots} snapshots, "
+              f"{restore * 1_000_000:.0f}us per restore")
+
+
+if __name__ == "__main__":
+    benchmark_caretakers()
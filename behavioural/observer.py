@@ -8,27 +8,756 @@ It is used in event handling in the browser (events propagated to various compon
 Observer vs Mediator
 - Observer is a subscriber / messaging system, where the observer initiates the communication with its subscribers. There are no properties on the user objects to indicate which observers they are subscribed to.
 - The mediator is an object attached as a plug-in to facilitate communication between two or more objects that don't have any knowledge of each other. The users are the ones that initiate communication.
+
+Subscriber storage:
+- Subscribers are held in a dict (used as an insertion-ordered set), so subscribe and unsubscribe are O(1). Entries are keyed by the subscriber's identity (for a bound method, its object and function) rather than by its own __eq__ / __hash__, so unhashable subscribers work and two distinct subscribers that compare equal are never merged. publish() iterates an immutable tuple snapshot of the subscribers, which is only rebuilt after membership changes. Subscribing or unsubscribing from inside a receive() callback, or from another thread, therefore never affects a publish that is already in progress.
+
+Topics:
+- Subscribers can subscribe to a dot-separated topic pattern rather than to everything, where '*' matches exactly one segment and '#' matches zero or more (e.g. 'orders.*.shipped', 'orders.#'). Patterns are stored in a trie keyed by segment, and a message's topic is matched by walking only the branches that can match it. The resulting tuple of subscribers is cached per topic until membership next changes, so publish cost depends on the number of matching subscribers rather than the total. Subscribers without a topic still receive every message.
+
+Delivery:
+- publish_many() delivers a batch of messages, with each subscriber receiving its matching messages in order. Exceptions raised by a subscriber are caught and counted rather than stopping delivery to the others. With delivery="threads", each subscriber's share of a publish runs as a task on a thread pool, so one slow subscriber no longer holds up the rest or the publisher (join() waits for outstanding deliveries). Each subscriber has at most one such task at a time, which works through its queued batches in publish order, so a subscriber never receives messages concurrently or out of order. publish_async() / publish_many_async() deliver concurrently on asyncio instead, awaiting coroutine receive() methods and running plain ones in a worker thread. stats() gives a list of (subscriber, stats) pairs, or one subscriber's stats, with the error count and, if the broker was created with track_stats=True, its delivery count and latency (max_seconds is the worst per-message average over a single publish). Timing is opt-in as it costs more per delivery than the delivery itself for trivial subscribers.
+
+Weak subscribers:
+- A subscriber can be any object with a receive() method, or any callable such as a function or bound method. By default the broker holds strong references, so a subscriber that never unsubscribes is never freed. With weak=True the broker holds weak references instead (WeakMethod for bound methods), and subscribers are dropped automatically once they are garbage collected. Note a lambda subscribed weakly is collected straight away unless something else holds on to it.
+
+Durable broker:
+- DurableMessageBroker appends every published message to a log on disk before delivering it, so messages published while a subscriber is offline are not lost. The log is split into segment files of about segment_bytes, each named after the offset of its first message, and each record carries a CRC so a partly written final record is dropped on restart (consumer offsets past the new end are moved back to it). A damaged record part way through an earlier segment cuts that segment short, leaving a gap in the offsets which reads skip over. Appends are buffered and written batch_size messages at a time (and at least every flush_interval seconds by a background thread). fsync="batch" syncs every write, "interval" syncs once per flush_interval and "never" leaves it to the OS. Reads go through a memory map of each segment. Subscribing with a consumer name tracks that subscriber's offset, which is saved to the log directory alongside the messages: subscribe() first replays the log from start - an offset, "earliest" or "latest", and by default the consumer's last offset, or "latest" for a new consumer - then delivers live messages. Message contents must be JSON serialisable.
 '''
 
+import asyncio
+import atexit
+import inspect
+import json
+import mmap
+import os
+import random
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import tracemalloc
+import weakref
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
 
 class Message:
-    def __init__(self, content):
+    def __init__(self, content, topic=None):
         self.content = content
+        self.topic = topic
+        # Position in a MessageLog, once a DurableMessageBroker has published it
+        self.offset = None
 
 
-class MessageBroker:
+class TopicNode:
     def __init__(self):
-        self._subscribers = []
+        self.children = {}
+        # subscriber -> subscription sequence number, so deliveries follow subscription order
+        self.subscribers = {}
+
+
+def identity_key(subscriber):
+    # Bound methods are created afresh on each attribute access, so key them by their object and function
+    if inspect.ismethod(subscriber):
+        return id(subscriber.__self__), id(subscriber.__func__)
+    return id(subscriber)
+
+
+class IdentityEntry:
+    # Hashes and compares by the identity of the subscriber, never calling its own __eq__ / __hash__
+    __slots__ = ()
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        # A live entry keeps its subscriber's ids in use, so equal keys mean the same subscriber
+        return self is other or (self.key == other.key and self() is not None and other() is not None)
+
+    def __hash__(self):
+        return hash(self.key)
+
+
+class SubscriberEntry(IdentityEntry):
+    # A strong reference to a subscriber, called like a weak reference to get it back
+    __slots__ = ("subscriber", "key")
+
+    def __init__(self, subscriber):
+        self.subscriber = subscriber
+        self.key = identity_key(subscriber)
+
+    def __call__(self):
+        return self.subscriber
+
+
+class SubscriberReference(IdentityEntry, weakref.ref):
+    def __init__(self, subscriber, callback=None):
+        super().__init__(subscriber, callback)
+        self.key = identity_key(subscriber)
+
+
+class SubscriberMethodReference(IdentityEntry, weakref.WeakMethod):
+    def __init__(self, method, callback=None):
+        super().__init__(method, callback)
+        self.key = identity_key(method)
+
+
+class SubscriberStats:
+    def __init__(self):
+        self.deliveries = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_error = None
+
+    @property
+    def mean_seconds(self):
+        return self.total_seconds / self.deliveries if self.deliveries else 0.0
+
+
+class MessageBroker:
+    # Publish-time snapshots are cached per topic, up to this many topics
+    cache_limit = 10_000
+    delivery_modes = ("sync", "threads")
+
+    def __init__(self, delivery="sync", workers=8, track_stats=False, weak=False):
+        if delivery not in self.delivery_modes:
+            raise ValueError(f"delivery must be one of {self.delivery_modes}")
+        self._subscribers = {}
+        self._topics = TopicNode()
+        self._sequence = 0
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self.delivery = delivery
+        self.track_stats = track_stats
+        self.weak = weak
+        # References to garbage-collected subscribers, waiting to be purged
+        self._dead = deque()
+        self._executor = ThreadPoolExecutor(workers) if delivery == "threads" else None
+        self._pending = set()
+        # subscriber -> batches waiting for the task already delivering to it
+        self._queued = {}
+        # The topics (None for everything) each subscriber is subscribed to
+        self._subscriptions = {}
+        # The one entry used for each subscriber in every structure, as dead weak references only equal themselves
+        self._canonical = {}
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def _entry(self, subscriber, callback=None):
+        # How a subscriber is held - strongly, or by a weak reference in weak mode - keyed by identity either way
+        if not self.weak:
+            return SubscriberEntry(subscriber)
+        if inspect.ismethod(subscriber):
+            return SubscriberMethodReference(subscriber, callback)
+        return SubscriberReference(subscriber, callback)
+
+    def _resolve(self, entry):
+        return entry()
 
-    def subscribe(self, subscriber):
-        self._subscribers.append(subscriber)
+    def _collected(self, reference):
+        # Runs during garbage collection, possibly while the lock is held, so only queue the purge
+        self._dead.append(reference)
+        self._snapshots = {}
 
-    def unsubscribe(self, subscriber):
-        self._subscribers.remove(subscriber)
+    def _purge(self):
+        # Caller must hold self._lock
+        while self._dead:
+            entry = self._dead.popleft()
+            for topic in list(self._subscriptions.get(entry, ())):
+                self._remove(entry, topic)
+
+    def subscribe(self, subscriber, topic=None):
+        with self._lock:
+            self._purge()
+            entry = self._entry(subscriber, self._collected)
+            entry = self._canonical.setdefault(entry, entry)
+            if topic is None:
+                if entry in self._subscribers:
+                    return
+                self._subscribers[entry] = None
+            else:
+                node = self._topics
+                for segment in topic.split("."):
+                    node = node.children.setdefault(segment, TopicNode())
+                if entry in node.subscribers:
+                    return
+                node.subscribers[entry] = self._sequence
+                self._sequence += 1
+            self._subscriptions.setdefault(entry, set()).add(topic)
+            self._snapshots = {}
+
+    def unsubscribe(self, subscriber, topic=None):
+        with self._lock:
+            self._purge()
+            self._remove(self._entry(subscriber), topic)
+
+    def _remove(self, entry, topic):
+        # Caller must hold self._lock
+        if topic is None:
+            if entry not in self._subscribers:
+                raise ValueError("Subscriber is not subscribed")
+            del self._subscribers[entry]
+        else:
+            path = [self._topics]
+            for segment in topic.split("."):
+                path.append(path[-1].children.get(segment))
+                if path[-1] is None:
+                    break
+            if path[-1] is None or entry not in path[-1].subscribers:
+                raise ValueError(f"Subscriber is not subscribed to {topic}")
+            del path[-1].subscribers[entry]
+            # Prune nodes left with no subscribers and no children
+            for parent, node, segment in reversed(list(zip(path, path[1:], topic.split(".")))):
+                if node.subscribers or node.children:
+                    break
+                del parent.children[segment]
+        topics = self._subscriptions[entry]
+        topics.discard(topic)
+        if not topics:
+            del self._subscriptions[entry]
+            del self._canonical[entry]
+            with self._stats_lock:
+                self._stats.pop(entry, None)
+        self._snapshots = {}
+
+    def _match(self, node, segments, index, matched):
+        hash_node = node.children.get("#")
+        if hash_node is not None:
+            # '#' matches zero or more segments
+            for next_index in range(index, len(segments) + 1):
+                self._match(hash_node, segments, next_index, matched)
+        if index == len(segments):
+            for subscriber, sequence in node.subscribers.items():
+                if sequence < matched.get(subscriber, sequence + 1):
+                    matched[subscriber] = sequence
+            return
+        for segment in (segments[index], "*"):
+            child = node.children.get(segment)
+            if child is not None:
+                self._match(child, segments, index + 1, matched)
+
+    def _current_subscribers(self, topic=None):
+        snapshot = self._snapshots.get(topic)
+        if snapshot is None:
+            with self._lock:
+                self._purge()
+                snapshot = self._snapshots.get(topic)
+                if snapshot is None:
+                    matched = {}
+                    if topic is not None:
+                        self._match(self._topics, topic.split("."), 0, matched)
+                    snapshot = tuple(self._subscribers) + tuple(
+                        subscriber for subscriber in sorted(matched, key=matched.get)
+                        if subscriber not in self._subscribers)
+                    if len(self._snapshots) >= self.cache_limit:
+                        self._snapshots = {}
+                    self._snapshots[topic] = snapshot
+        return snapshot
+
+    def _group_by_subscriber(self, messages):
+        deliveries = {}
+        for message in messages:
+            for subscriber in self._current_subscribers(message.topic):
+                deliveries.setdefault(subscriber, []).append(message)
+        return deliveries
+
+    def _record(self, subscriber, count, seconds, errors, last_error):
+        # Called once per subscriber per publish, so seconds covers all of its messages
+        with self._stats_lock:
+            stats = self._stats.get(subscriber)
+            if stats is None:
+                if subscriber not in self._subscriptions:
+                    # Unsubscribed while this delivery was in flight
+                    return
+                stats = self._stats[subscriber] = SubscriberStats()
+            if count:
+                stats.deliveries += count
+                stats.total_seconds += seconds
+                stats.max_seconds = max(stats.max_seconds, seconds / count)
+            if errors:
+                stats.errors += errors
+                stats.last_error = last_error
+
+    def _receiver(self, entry):
+        # Subscribers are objects with a receive() method, or plain callables
+        subscriber = self._resolve(entry)
+        if subscriber is None:
+            return None
+        return getattr(subscriber, "receive", subscriber)
+
+    def _deliver(self, entry, messages):
+        receive = self._receiver(entry)
+        if receive is None:
+            return
+        if not self.track_stats:
+            for message in messages:
+                try:
+                    receive(message)
+                except Exception as exception:
+                    self._record(entry, 0, 0.0, 1, exception)
+            return
+        errors = 0
+        last_error = None
+        start = time.perf_counter()
+        for message in messages:
+            try:
+                receive(message)
+            except Exception as exception:
+                errors += 1
+                last_error = exception
+        self._record(entry, len(messages), time.perf_counter() - start, errors, last_error)
 
     def publish(self, message):
-        for subscriber in self._subscribers:
-            subscriber.receive(message)
+        self.publish_many((message,))
+
+    def publish_many(self, messages):
+        messages = list(messages)
+        if len(messages) == 1:
+            # Skip the grouping for a single message
+            deliveries = ((subscriber, messages)
+                          for subscriber in self._current_subscribers(messages[0].topic))
+        else:
+            deliveries = self._group_by_subscriber(messages).items()
+        if self._executor is None:
+            for subscriber, subscriber_messages in deliveries:
+                self._deliver(subscriber, subscriber_messages)
+            return
+        for subscriber, subscriber_messages in deliveries:
+            with self._lock:
+                queued = self._queued.get(subscriber)
+                if queued is not None:
+                    # A task is already delivering to this subscriber, and will pick these up in order
+                    queued.append(subscriber_messages)
+                    continue
+                self._queued[subscriber] = deque([subscriber_messages])
+                future = self._executor.submit(self._drain, subscriber)
+                self._pending.add(future)
+            future.add_done_callback(self._finished)
+
+    def _drain(self, entry):
+        # Deliveries to one subscriber run one at a time, in publish order
+        while True:
+            with self._lock:
+                queued = self._queued[entry]
+                if not queued:
+                    del self._queued[entry]
+                    return
+                messages = queued.popleft()
+            self._deliver(entry, messages)
+
+    def _finished(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def join(self, timeout=None):
+        # Wait for deliveries already handed to the thread pool
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending, timeout)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    async def _deliver_async(self, entry, messages):
+        receive = self._receiver(entry)
+        if receive is None:
+            return
+        errors = 0
+        last_error = None
+        start = time.perf_counter()
+        for message in messages:
+            try:
+                if inspect.iscoroutinefunction(receive):
+                    await receive(message)
+                else:
+                    await asyncio.to_thread(receive, message)
+            except Exception as exception:
+                errors += 1
+                last_error = exception
+        if self.track_stats:
+            self._record(entry, len(messages), time.perf_counter() - start, errors, last_error)
+        elif errors:
+            # As with _deliver, only errors are recorded unless stats were asked for
+            self._record(entry, 0, 0.0, errors, last_error)
+
+    async def publish_async(self, message):
+        await self.publish_many_async((message,))
+
+    async def publish_many_async(self, messages):
+        await self._deliver_all_async(self._group_by_subscriber(list(messages)))
+
+    async def _deliver_all_async(self, deliveries):
+        await asyncio.gather(*(self._deliver_async(subscriber, list(subscriber_messages))
+                               for subscriber, subscriber_messages in deliveries.items()))
+
+    def stats(self, subscriber=None):
+        with self._stats_lock:
+            if subscriber is not None:
+                return self._stats.get(self._entry(subscriber), SubscriberStats())
+            resolved = [(self._resolve(entry), stats) for entry, stats in self._stats.items()]
+        return [(subscriber, stats) for subscriber, stats in resolved if subscriber is not None]
+
+
+class MessageLog:
+    # Each record is a CRC32 of the rest of the record, the topic length (-1 for no topic)
+    # and the content length, followed by the UTF-8 topic and the JSON-encoded content
+    header = struct.Struct("<Iii")
+    lengths = struct.Struct("<ii")
+    fsync_policies = ("batch", "interval", "never")
+
+    def __init__(self, directory, segment_bytes=64 * 1024 ** 2, batch_size=1000,
+                 flush_interval=1.0, fsync="interval"):
+        if fsync not in self.fsync_policies:
+            raise ValueError(f"fsync must be one of {self.fsync_policies}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        # Per segment: its first offset, the byte position of each record, bytes written and a memory map
+        self.bases = []
+        self.positions = []
+        self.sizes = []
+        self.mappings = []
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".log"):
+                self._load_segment(int(name[:-len(".log")]))
+        if not self.bases:
+            self._add_segment(0)
+        self.start = self.bases[0]
+        self.end = self.bases[-1] + len(self.positions[-1])
+        self.file = open(self._segment_path(self.bases[-1]), "ab")
+        self.segment_size = self.sizes[-1]
+        self.buffer = bytearray()
+        self.buffered = 0
+        self.offsets_path = os.path.join(directory, "offsets.json")
+        self.consumer_offsets = {}
+        self.offsets_changed = False
+        if os.path.exists(self.offsets_path):
+            with open(self.offsets_path, encoding="utf-8") as file:
+                saved_offsets = json.load(file)
+            # A torn tail can leave consumers past the end of the log, where they would skip
+            # the new messages given the lost records' offsets
+            self.consumer_offsets = {consumer: min(offset, self.end)
+                                     for consumer, offset in saved_offsets.items()}
+            self.offsets_changed = self.consumer_offsets != saved_offsets
+        self.encoded_topics = {}
+        self.encode_content = json.JSONEncoder(separators=(",", ":")).encode
+        self.closed = False
+        self.lock = threading.Lock()
+        self.flush_needed = threading.Condition(self.lock)
+        self.flusher = threading.Thread(target=self._run_flusher, daemon=True)
+        self.flusher.start()
+        atexit.register(self.close)
+
+    def _segment_path(self, base):
+        return os.path.join(self.directory, f"{base:020d}.log")
+
+    def _add_segment(self, base):
+        self.bases.append(base)
+        self.positions.append(array("Q"))
+        self.sizes.append(0)
+        self.mappings.append(None)
+
+    def _load_segment(self, base):
+        self._add_segment(base)
+        path = self._segment_path(base)
+        size = os.path.getsize(path)
+        if not size:
+            return
+        with open(path, "rb") as file:
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        positions = self.positions[-1]
+        position = 0
+        while position + self.header.size <= size:
+            crc, topic_length, content_length = self.header.unpack_from(mapping, position)
+            record_end = position + self.header.size + max(topic_length, 0) + content_length
+            if record_end > size or zlib.crc32(mapping[position + 4:record_end]) != crc:
+                break
+            positions.append(position)
+            position = record_end
+        if position < size:
+            # A partly written final record from a crash - drop it
+            mapping.close()
+            mapping = None
+            os.truncate(path, position)
+        self.sizes[-1] = position
+        self.mappings[-1] = mapping
+
+    def _encode(self, message):
+        topic = self.encoded_topics.get(message.topic)
+        if topic is None:
+            if message.topic is None:
+                topic = (-1, b"")
+            else:
+                topic_bytes = message.topic.encode("utf-8")
+                topic = (len(topic_bytes), topic_bytes)
+            if len(self.encoded_topics) < 10_000:
+                self.encoded_topics[message.topic] = topic
+        content = self.encode_content(message.content).encode("utf-8")
+        body = self.lengths.pack(topic[0], len(content)) + topic[1] + content
+        return zlib.crc32(body).to_bytes(4, "little") + body
+
+    def _append(self, message):
+        # Caller must hold self.lock
+        if self.segment_size >= self.segment_bytes:
+            self._roll()
+        record = self._encode(message)
+        self.positions[-1].append(self.segment_size)
+        self.buffer += record
+        self.segment_size += len(record)
+        message.offset = self.end
+        self.end += 1
+        self.buffered += 1
+
+    def append(self, message):
+        # Sets the message's offset, and returns it
+        with self.lock:
+            if self.closed:
+                raise ValueError("Cannot append to a closed MessageLog")
+            self._append(message)
+            if self.buffered >= self.batch_size:
+                self._write_buffer()
+            return message.offset
+
+    def append_many(self, messages):
+        # Returns the offset of the first message
+        with self.lock:
+            if self.closed:
+                raise ValueError("Cannot append to a closed MessageLog")
+            first = self.end
+            for message in messages:
+                self._append(message)
+            if self.buffered >= self.batch_size:
+                self._write_buffer()
+            return first
+
+    def _roll(self):
+        # Caller must hold self.lock
+        self._write_buffer()
+        if self.fsync != "never":
+            os.fsync(self.file.fileno())
+        self.file.close()
+        self._add_segment(self.end)
+        self.file = open(self._segment_path(self.end), "ab")
+        self.segment_size = 0
+
+    def _write_buffer(self, sync=False):
+        # Caller must hold self.lock
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.file.flush()
+            self.buffer.clear()
+            self.buffered = 0
+            self.sizes[-1] = self.segment_size
+            sync = sync or self.fsync == "batch"
+        if sync and self.fsync != "never":
+            os.fsync(self.file.fileno())
+        # Offsets are saved after the messages they refer to, so never run ahead of the log
+        if self.offsets_changed and (sync or self.fsync != "interval"):
+            self._save_offsets()
+
+    def _save_offsets(self):
+        temporary_path = self.offsets_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(self.consumer_offsets, file)
+            if self.fsync != "never":
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temporary_path, self.offsets_path)
+        self.offsets_changed = False
+
+    def _run_flusher(self):
+        with self.lock:
+            while not self.closed:
+                self.flush_needed.wait(self.flush_interval)
+                if not self.closed:
+                    self._write_buffer(sync=self.fsync == "interval")
+
+    def flush(self):
+        with self.lock:
+            self._write_buffer(sync=True)
+
+    def commit(self, consumer, offset):
+        if consumer in self.consumer_offsets:
+            # Replacing a value is atomic, and cannot upset a save in progress
+            self.consumer_offsets[consumer] = offset
+        else:
+            with self.lock:
+                self.consumer_offsets[consumer] = offset
+        self.offsets_changed = True
+
+    def _mapping(self, index):
+        # Caller must hold self.lock
+        mapping = self.mappings[index]
+        if mapping is None or len(mapping) < self.sizes[index]:
+            # The segment has grown since it was last mapped. The old map is left for any
+            # reader still using it to drop, rather than closed under it
+            with open(self._segment_path(self.bases[index]), "rb") as file:
+                mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.mappings[index] = mapping
+        return mapping
+
+    def read(self, start=None, stop=None):
+        # Yields the messages from start (the oldest by default) up to stop (the current end by default)
+        with self.lock:
+            self._write_buffer()
+            start = self.start if start is None else start
+            stop = self.end if stop is None else min(stop, self.end)
+        if not self.start <= start <= self.end:
+            raise ValueError(f"Offset {start} is outside the log ({self.start} to {self.end})")
+        header_size = self.header.size
+        offset = start
+        while offset < stop:
+            with self.lock:
+                index = bisect_right(self.bases, offset) - 1
+                base = self.bases[index]
+                positions = self.positions[index]
+                if offset - base >= len(positions):
+                    # Records dropped from a damaged earlier segment leave a gap up to the next one
+                    offset = self.bases[index + 1] if index + 1 < len(self.bases) else stop
+                    continue
+                mapping = self._mapping(index)
+            for position in positions[offset - base:min(stop - base, len(positions))]:
+                _, topic_length, content_length = self.header.unpack_from(mapping, position)
+                position += header_size
+                topic = None
+                if topic_length >= 0:
+                    topic = str(mapping[position:position + topic_length], "utf-8")
+                    position += topic_length
+                message = Message(json.loads(mapping[position:position + content_length]), topic)
+                message.offset = offset
+                offset += 1
+                yield message
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.flush_needed.notify()
+        self.flusher.join()
+        with self.lock:
+            self._write_buffer(sync=True)
+            self.file.close()
+        atexit.unregister(self.close)
+
+
+class DurableMessageBroker(MessageBroker):
+    def __init__(self, directory, segment_bytes=64 * 1024 ** 2, batch_size=1000,
+                 flush_interval=1.0, fsync="interval", **options):
+        super().__init__(**options)
+        self.log = MessageLog(directory, segment_bytes, batch_size, flush_interval, fsync)
+        # subscriber -> consumer name, for subscribers whose offset is tracked
+        self._consumers = {}
+        # Held across appending and delivering, so a subscriber catching up never misses or repeats a message
+        self._publish_lock = threading.RLock()
+
+    def subscribe(self, subscriber, topic=None, consumer=None, start=None):
+        # start is an offset, "earliest" or "latest". By default a known consumer resumes
+        # from its last offset, and a new one starts from the latest message
+        if consumer is None:
+            super().subscribe(subscriber, topic)
+            return
+        with self._publish_lock:
+            if consumer in self._consumers.values():
+                raise ValueError(f"Consumer {consumer} is already subscribed")
+            if start is None:
+                start = self.log.consumer_offsets.get(consumer, "latest")
+            if start == "earliest":
+                start = self.log.start
+            elif start == "latest":
+                start = self.log.end
+            if not isinstance(start, int) or not self.log.start <= start <= self.log.end:
+                raise ValueError(f"start must be an offset from {self.log.start} to {self.log.end}, "
+                                 f"'earliest' or 'latest'")
+            super().subscribe(subscriber, topic)
+            entry = self._canonical[self._entry(subscriber)]
+            self._consumers[entry] = consumer
+            # Catch up on everything published since start before receiving live messages
+            batch = []
+            for message in self.log.read(start):
+                if self._matches(topic, message.topic):
+                    batch.append(message)
+                    if len(batch) >= self.log.batch_size:
+                        self._deliver(entry, batch)
+                        batch = []
+            if batch:
+                self._deliver(entry, batch)
+            self.log.commit(consumer, self.log.end)
+
+    def _matches(self, pattern, topic):
+        # The same rules as the topic trie
+        if pattern is None:
+            return True
+        if topic is None:
+            return False
+        return self._segments_match(pattern.split("."), 0, topic.split("."), 0)
+
+    def _segments_match(self, pattern, pattern_index, segments, index):
+        if pattern_index == len(pattern):
+            return index == len(segments)
+        if pattern[pattern_index] == "#":
+            return any(self._segments_match(pattern, pattern_index + 1, segments, next_index)
+                       for next_index in range(index, len(segments) + 1))
+        return (index < len(segments) and pattern[pattern_index] in (segments[index], "*")
+                and self._segments_match(pattern, pattern_index + 1, segments, index + 1))
+
+    def _remove(self, entry, topic):
+        super()._remove(entry, topic)
+        if entry not in self._subscriptions:
+            # The consumer's offset is kept, so it can resume later
+            self._consumers.pop(entry, None)
+
+    def offset(self, consumer):
+        return self.log.consumer_offsets.get(consumer)
+
+    def _commit(self, entry, messages):
+        consumer = self._consumers.get(entry)
+        if consumer is not None:
+            self.log.commit(consumer, messages[-1].offset + 1)
+
+    def _deliver(self, entry, messages):
+        super()._deliver(entry, messages)
+        self._commit(entry, messages)
+
+    async def _deliver_async(self, entry, messages):
+        await super()._deliver_async(entry, messages)
+        self._commit(entry, messages)
+
+    def publish(self, message):
+        with self._publish_lock:
+            offset = self.log.append(message)
+            super().publish_many((message,))
+        return offset
+
+    def publish_many(self, messages):
+        # Returns the offset of the first message
+        messages = list(messages)
+        with self._publish_lock:
+            offset = self.log.append_many(messages)
+            super().publish_many(messages)
+        return offset
+
+    async def publish_many_async(self, messages):
+        messages = list(messages)
+        # The lock cannot be held across an await, so only the append and choosing who receives
+        # the messages are done under it - enough that a subscriber catching up sees each message once
+        with self._publish_lock:
+            self.log.append_many(messages)
+            deliveries = self._group_by_subscriber(messages)
+        await self._deliver_all_async(deliveries)
+
+    def close(self):
+        super().close()
+        self.log.close()
 
 
 class Subscriber:
@@ -56,3 +785,168 @@ broker.unsubscribe(subscriber2)
 
 message = Message("Observer 2 unsubscribed.")
 broker.publish(message)
+
+
+# Unsubscribing from inside a callback does not disturb the publish in progress
+class OneShotSubscriber(Subscriber):
+    def receive(self, message):
+        super().receive(message)
+        broker.unsubscribe(self)
+
+
+broker.subscribe(OneShotSubscriber("One-shot subscriber"))
+broker.publish(Message("First message"))  # Delivered to subscribers 1, 3 and the one-shot subscriber
+broker.publish(Message("Second message"))  # The one-shot subscriber has gone
+
+# Topic subscriptions with wildcards
+topic_broker = MessageBroker()
+topic_broker.subscribe(Subscriber("Shipping"), "orders.*.shipped")
+topic_broker.subscribe(Subscriber("Audit"), "orders.#")
+topic_broker.publish(Message("Order 1 shipped", "orders.uk.shipped"))  # Shipping and Audit
+topic_broker.publish(Message("Order 2 placed", "orders.uk.placed"))  # Audit only
+
+
+# Threaded batch delivery - a failing subscriber does not stop the others
+class FailingSubscriber(Subscriber):
+    def receive(self, message):
+        raise RuntimeError("Subscriber failed")
+
+
+class AsyncSubscriber(Subscriber):
+    async def receive(self, message):
+        await asyncio.sleep(0.01)
+        print(f"{self.name} received message: {message.content}")
+
+
+threaded_broker = MessageBroker(delivery="threads", track_stats=True)
+failing = FailingSubscriber("Failing")
+reliable = Subscriber("Reliable")
+threaded_broker.subscribe(failing)
+threaded_broker.subscribe(reliable)
+threaded_broker.publish_many([Message("Batch 1"), Message("Batch 2")])
+threaded_broker.join()  # Reliable received message: Batch 1, then Batch 2
+print(threaded_broker.stats(failing).errors, threaded_broker.stats(reliable).deliveries)  # 2 2
+threaded_broker.close()
+
+async_broker = MessageBroker()
+async_broker.subscribe(AsyncSubscriber("Async 1"))
+async_broker.subscribe(AsyncSubscriber("Async 2"))
+asyncio.run(async_broker.publish_async(Message("Delivered concurrently")))
+
+
+class CountingSubscriber(Subscriber):
+    received = 0
+
+    def receive(self, message):
+        CountingSubscriber.received += 1
+
+
+def benchmark_topics(subscriptions=100_000, publishes=10_000):
+    rng = random.Random(0)
+    regions = [f"region{i}" for i in range(1000)]
+    statuses = [f"status{i}" for i in range(100)]
+    flat_broker = MessageBroker()
+    routed_broker = MessageBroker()
+    for i in range(subscriptions):
+        subscriber = CountingSubscriber(str(i))
+        flat_broker.subscribe(subscriber)
+        if i % 100 == 0:
+            routed_broker.subscribe(subscriber, f"orders.{rng.choice(regions)}.#")
+        elif i % 10 == 0:
+            routed_broker.subscribe(subscriber, f"orders.*.{rng.choice(statuses)}")
+        else:
+            routed_broker.subscribe(subscriber, f"orders.{rng.choice(regions)}.{rng.choice(statuses)}")
+    topics = [f"orders.{rng.choice(regions)}.{rng.choice(statuses)}" for _ in range(publishes)]
+    for label, target, count in (("All subscribers", flat_broker, 20), ("Topic routed", routed_broker, publishes)):
+        CountingSubscriber.received = 0
+        start = time.perf_counter()
+        for topic in topics[:count]:
+            target.publish(Message("Update", topic))
+        elapsed = time.perf_counter() - start
+        print(f"{label}: {elapsed / count * 1_000_000:,.0f}us per publish, "
+              f"{CountingSubscriber.received / count:,.1f} deliveries per publish")
+
+
+# Weak subscribers - short-lived subscribers are dropped once garbage collected
+class Dashboard:
+    def __init__(self, name):
+        self.name = name
+
+    def on_message(self, message):
+        print(f"{self.name} dashboard shows: {message.content}")
+
+
+weak_broker = MessageBroker(weak=True)
+dashboard = Dashboard("Sales")
+weak_broker.subscribe(dashboard.on_message)  # Bound method callback, held by WeakMethod
+weak_broker.subscribe(Subscriber("Temporary"))  # Nothing else refers to it, so it is collected
+weak_broker.publish(Message("Weakly delivered"))  # Only the Sales dashboard receives this
+del dashboard
+weak_broker.publish(Message("Nobody left"))
+
+
+def soak_weak_subscribers(rounds=10, subscribers_per_round=2_000):
+    # Subscribers that never unsubscribe: memory grows with strong references, stays flat with weak ones
+    for weak in (False, True):
+        soak_broker = MessageBroker(weak=weak)
+        tracemalloc.start()
+        readings = []
+        for _ in range(rounds):
+            for i in range(subscribers_per_round):
+                soak_broker.subscribe(CountingSubscriber(str(i)))
+            soak_broker.publish(Message("Soak"))
+            readings.append(tracemalloc.get_traced_memory()[0])
+        tracemalloc.stop()
+        label = "Weak" if weak else "Strong"
+        print(f"{label} references: {readings[0] / 1024 ** 2:.1f} MB after round 1, "
+              f"{readings[-1] / 1024 ** 2:.1f} MB after round {rounds}")
+
+
+# Durable broker - messages are kept in a log on disk, and consumers resume from their own offset
+log_directory = tempfile.mkdtemp()
+durable_broker = DurableMessageBroker(log_directory)
+durable_broker.publish(Message("Order 1 placed", "orders.placed"))
+billing = Subscriber("Billing")
+durable_broker.subscribe(billing, "orders.#", consumer="billing", start="earliest")  # Replays order 1
+durable_broker.publish(Message("Order 2 placed", "orders.placed"))  # Delivered live
+durable_broker.unsubscribe(billing, "orders.#")
+durable_broker.publish(Message("Order 3 placed", "orders.placed"))  # Billing is offline
+durable_broker.close()
+
+durable_broker = DurableMessageBroker(log_directory)  # Restarted - the log and offsets are read back from disk
+durable_broker.subscribe(billing, "orders.#", consumer="billing")  # Resumes with order 3
+durable_broker.subscribe(Subscriber("Analytics"), consumer="analytics", start=1)  # Replays orders 2 and 3
+print(durable_broker.offset("billing"), durable_broker.offset("analytics"))  # 3 3
+durable_broker.close()
+shutil.rmtree(log_directory)
+
+
+def benchmark_durable(messages=200_000, batch=1000):
+    topics = [f"orders.region{i % 100}.placed" for i in range(messages)]
+    for fsync in ("interval", "batch"):
+        directory = tempfile.mkdtemp()
+        benchmark_broker = DurableMessageBroker(directory, segment_bytes=4 * 1024 ** 2, fsync=fsync)
+        benchmark_broker.subscribe(CountingSubscriber("Live"), "orders.#", consumer="live")
+        start = time.perf_counter()
+        for topic in topics:
+            benchmark_broker.publish(Message({"quantity": 1}, topic))
+        benchmark_broker.log.flush()
+        single = messages / (time.perf_counter() - start)
+        start = time.perf_counter()
+        for i in range(0, messages, batch):
+            benchmark_broker.publish_many(Message({"quantity": 1}, topic) for topic in topics[i:i + batch])
+        benchmark_broker.log.flush()
+        batched = messages / (time.perf_counter() - start)
+        start = time.perf_counter()
+        replayed = sum(1 for _ in benchmark_broker.log.read())
+        replay = replayed / (time.perf_counter() - start)
+        print(f"fsync={fsync}: {single:,.0f} msgs/sec published one at a time, {batched:,.0f} msgs/sec in "
+              f"batches of {batch}, {replay:,.0f} msgs/sec replayed across {len(benchmark_broker.log.bases)} segments")
+        benchmark_broker.close()
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    benchmark_topics()
+    soak_weak_subscribers()
+    benchmark_durable()
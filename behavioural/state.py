@@ -9,8 +9,14 @@ Example:
 State in this case could be something like order status e.g. shipped or cancelled below. The ship and cancel methods may behave very differently depending on this state. Extensive conditional loops within every method of the order object can be avoided, and additional / new behaviours can be added more easily.
 
 Other examples incude UI systems, where the screen may be enabled, disabled or read-only, ecommerce systems where an object may be at full price, discounted, or part of an wider offer structure.
+
+Table-driven states:
+- The classic example below creates a new state object on every transition. TableOrder's states and transitions are instead compiled from a declarative table of (state, event, next state, message) rows by StateMachine. Each state is a single shared TableOrderState holding only its transitions, so moving an order between states allocates nothing, and TableOrder uses __slots__ to store nothing but a reference to its current state - millions of live orders take a few tens of bytes each. An event the table does not allow, or allows with no next state, leaves the order in its current state.
 '''
 
+import time
+import tracemalloc
+
 
 class OrderState:
     def ship(self):
@@ -35,17 +41,21 @@ class NewOrderState(OrderState):
 class ShippedOrderState(OrderState):
     def ship(self):
         print("The order has already been shipped.")
+        return self
 
     def cancel(self):
         print("Cannot cancel a shipped order.")
+        return self
 
 
 class CancelledOrderState(OrderState):
     def ship(self):
         print("Cannot ship a cancelled order.")
+        return self
 
     def cancel(self):
         print("The order has already been cancelled.")
+        return self
 
 
 class Order:
@@ -60,14 +70,121 @@ class Order:
         self.state = self.state.cancel()
 
 
+class TableOrderState:
+    # One instance per state, shared by every order in that state, so it holds no per-order data
+    __slots__ = ("name", "transitions", "output")
+
+    def __init__(self, name, output=print):
+        self.name = name
+        # event -> (next state, message)
+        self.transitions = {}
+        self.output = output
+
+    def handle(self, event):
+        transition = self.transitions.get(event)
+        if transition is None:
+            # Only an invalid event pays for formatting a message
+            if self.output is not None:
+                self.output(f"Cannot {event} an order that is {self.name}.")
+            return self
+        next_state, message = transition
+        if self.output is not None:
+            self.output(message)
+        return next_state
+
+    def ship(self):
+        return self.handle("ship")
+
+    def cancel(self):
+        return self.handle("cancel")
+
+
+class StateMachine:
+    def __init__(self, transitions, initial, output=print):
+        self.states = {}
+        for state, _, next_state, _ in transitions:
+            for name in (state, next_state):
+                if name is not None and name not in self.states:
+                    self.states[name] = TableOrderState(name, output)
+        for state, event, next_state, message in transitions:
+            source = self.states[state]
+            # A row without a next state leaves the order where it is
+            source.transitions[event] = (self.states[next_state] if next_state else source, message)
+        self.initial = self.states[initial]
+
+
+ORDER_TRANSITIONS = (
+    # state, event, next state, message
+    ("new", "ship", "shipped", "Shipping the order..."),
+    ("new", "cancel", "cancelled", "Cancelling the order..."),
+    ("shipped", "ship", None, "The order has already been shipped."),
+    ("shipped", "cancel", None, "Cannot cancel a shipped order."),
+    ("cancelled", "ship", None, "Cannot ship a cancelled order."),
+    ("cancelled", "cancel", None, "The order has already been cancelled."),
+)
+
+order_states = StateMachine(ORDER_TRANSITIONS, "new")
+
+
+class TableOrder:
+    __slots__ = ("state",)
+
+    def __init__(self, states=None):
+        # Initial state is new
+        self.state = (states or order_states).initial
+
+    def ship(self):
+        self.state = self.state.ship()
+
+    def cancel(self):
+        self.state = self.state.cancel()
+
+    def handle(self, event):
+        self.state = self.state.handle(event)
+
+
 # Usage example
 order = Order()
 
 # shipping the order, changes the state of the order to ShippedOrderState, which has its own ship and cancel implementations.
-order.ship()
+order.ship()  # Shipping the order...
 
+order.cancel()  # Cannot cancel a shipped order.
+order.ship()  # The order has already been shipped.
+
+order = Order()
 order.cancel()  # Cancelling the order...
 order.ship()  # Cannot ship a cancelled order.
-
 order.cancel()  # The order has already been cancelled.
-order.ship()  # Cannot ship a cancelled order.
+
+# Table-driven orders - the same behaviour, with every order sharing the compiled state objects
+table_order = TableOrder()
+table_order.ship()  # Shipping the order...
+table_order.cancel()  # Cannot cancel a shipped order.
+print(table_order.state.name)  # shipped
+
+cancelled_order = TableOrder()
+cancelled_order.cancel()  # Cancelling the order...
+cancelled_order.handle("refund")  # Cannot refund an order that is cancelled.
+print(cancelled_order.state.name, cancelled_order.state is order_states.states["cancelled"])  # cancelled True
+
+
+def benchmark_orders(count=1_000_000):
+    silent_states = StateMachine(ORDER_TRANSITIONS, "new", output=None)
+    tracemalloc.start()
+    orders = [TableOrder(silent_states) for _ in range(count)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for i, live_order in enumerate(orders):
+        if i % 2:
+            live_order.ship()
+        live_order.cancel()
+    elapsed = time.perf_counter() - start
+    shipped = sum(live_order.state is silent_states.states["shipped"] for live_order in orders)
+    print(f"{count:,} orders: {size / count:.0f} bytes per order, "
+          f"{count * 1.5 / elapsed:,.0f} transitions/sec, {shipped:,} shipped")
+
+
+if __name__ == "__main__":
+    benchmark_orders()